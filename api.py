@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+#CST:xvitas02
+
+"""!
+@package api.py
+Using the parser as a library.
+
+This module is the importable entry point of the statistics,
+cst.py is only a command line layer over it. Each call works
+with its own Parser, so it can be called any number of times,
+from several threads at once too.
+
+    from api import analyze
+    for name, record in analyze('src', metrics=['all_keywords', 'comments']):
+        print(name, record['all_keywords'], record['comments'])
+"""
+
+import itertools
+import mmap
+import os
+from archive import is_archive
+from arguments import Arguments
+from parser import Parser
+
+# the arguments which only change how the files are found and read, not what is counted
+options_list = ['subdirs', 'jobs', 'cache_dir', 'cache_size', 'chunk_size', 'exclude', 'include', 'extensions',
+                'follow_symlinks', 'dedup', 'prefetch', 'shard']
+
+
+def analyze(sources, metrics=('all_keywords', 'simp_ops', 'identifiers', 'comments'), patterns=None,
+            histogram=False, operator_histogram=False, **options):
+    """!
+    @brief Counts the occurrences in C sources.
+    A source is either a path (a file is counted whatever its
+    extension, a directory is walked like by --input, the files
+    of a tar or zip archive are read from the archive), the bytes
+    of a file, or a (name, bytes) tuple. Either a single source or
+    an iterable of them is accepted.
+
+    @param sources The source or the iterable of sources.
+    @param metrics The metric keys to count (Parser.metrics_list), 'word_search' is added by passing patterns.
+    @param patterns The word/string or the list of words/strings to search for (-w), None for none.
+    @param histogram True – count each of the keywords too ('keyword:<keyword>' keys)/False – do not
+    @param operator_histogram True – count each of the operators too ('operator:<operator>' keys)/False – do not
+    @param options Any of options_list, as in the dictionary of user-side arguments (e.g. jobs=4, exclude=['build']).
+    @return Returns the lazy iterator of (name, record of occurrences) tuples, one for each file, in the order
+    of the sources. The name is the path of a file, the name passed along with bytes or None for bare bytes.
+    The path of a file in an archive is the path to the archive followed by the path inside it.
+    It raises archive.ArchiveError when an archive is damaged.
+    """
+    return iterate_records(get_sources(sources), get_args_dict(metrics, patterns, histogram, operator_histogram,
+                                                               options))
+
+
+def get_args_dict(metrics, patterns, histogram, operator_histogram, options):
+    """!
+    @brief Turns the arguments of analyze into a dictionary of user-side arguments.
+
+    @param metrics The metric keys to count.
+    @param patterns The word/string or the list of words/strings to search for, None for none.
+    @param histogram Whether to count each of the keywords too.
+    @param operator_histogram Whether to count each of the operators too.
+    @param options The dictionary of other options.
+    @return Returns the dictionary of user-side arguments.
+    """
+    args_dict = Arguments().args_dict
+    for metric in metrics:
+        if metric not in Parser.metrics_list:
+            raise ValueError('unknown metric ' + repr(metric))
+        if metric != 'word_search':
+            args_dict[metric] = True
+    if patterns is not None:
+        args_dict['word_search'] = [patterns] if isinstance(patterns, str) else list(dict.fromkeys(patterns))
+        if '' in args_dict['word_search']:
+            raise ValueError('the pattern to search for cannot be empty')
+    elif 'word_search' in metrics:
+        raise ValueError('the word_search metric needs the patterns to search for')
+    if histogram is True:
+        args_dict['histogram'] = True
+        args_dict['all_keywords'] = True
+    if operator_histogram is True:
+        args_dict['operator_histogram'] = True
+        args_dict['simp_ops'] = True
+    for option in options:
+        if option not in options_list:
+            raise TypeError('analyze() got an unexpected keyword argument ' + repr(option))
+        args_dict[option] = options[option]
+    return args_dict
+
+
+def is_buffer(source):
+    """!
+    @brief Tells the content of a file from the other sources.
+
+    @param source The source passed to analyze.
+    @return Returns True for a bytes-like object.
+    """
+    return isinstance(source, (bytes, bytearray, memoryview, mmap.mmap))
+
+
+def get_source_kind(source):
+    """!
+    @brief Tells what a source is.
+
+    @param source The source passed to analyze.
+    @return Returns 'paths' for a file or directory, 'archives' for an archive, 'contents' for bytes.
+    """
+    if is_buffer(source) or isinstance(source, tuple):
+        return 'contents'
+    if is_archive(os.fspath(source)):
+        return 'archives'
+    return 'paths'
+
+
+def get_sources(sources):
+    """!
+    @brief Turns a single source into a list of one.
+
+    @param sources The source or the iterable of sources passed to analyze.
+    @return Returns the iterable of sources.
+    """
+    if isinstance(sources, (str, os.PathLike)) or is_buffer(sources):
+        return [sources]
+    if isinstance(sources, tuple) and len(sources) == 2 and is_buffer(sources[1]):
+        return [sources]
+    return sources
+
+
+def iterate_records(sources, args_dict, parser=None):
+    """!
+    @brief Counts the occurrences in each of the sources.
+    The paths next to each other are counted together, so their
+    files can be spread over the worker processes (jobs).
+
+    @param sources The iterable of sources.
+    @param args_dict The dictionary of user-side arguments.
+    @param parser The Parser to count with (e.g. to read its stats afterwards), a new one by default.
+    @return Yields tuples of the name and the record of occurrences.
+    """
+    if parser is None:
+        parser = Parser()
+    try:
+        for kind, group in itertools.groupby(sources, get_source_kind):
+            ### PATHS ###
+            if kind == 'paths':
+                files = itertools.chain.from_iterable((get_files(parser, path, args_dict) for path in group))
+                for filepath, record in parser.count_files(files, args_dict):
+                    yield filepath, record
+            ### END PATHS ###
+
+            ### ARCHIVES ###
+            elif kind == 'archives':
+                for path in group:
+                    for filepath, record in parser.count_archive(os.fspath(path), args_dict):
+                        yield filepath, record
+            ### END ARCHIVES ###
+
+            ### CONTENTS ###
+            else:
+                for source in group:
+                    name, data = source if isinstance(source, tuple) else (None, source)
+                    yield name, parser.count_content(data, args_dict)
+            ### END CONTENTS ###
+    finally:
+        parser.close_cache(args_dict, evict=True)
+
+
+def get_files(parser, path, args_dict):
+    """!
+    @brief Gets the files of a path.
+
+    @param parser The Parser walking the directories.
+    @param path The path to a file or a directory.
+    @param args_dict The dictionary of user-side arguments.
+    @return Returns the iterable of filepaths.
+    """
+    path = os.fspath(path)
+    if os.path.isdir(path):
+        return parser.walk_directory(path, args_dict)
+    return [path]
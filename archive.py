@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+#CST:xvitas02
+
+"""!
+@package archive.py
+Reading the files of tar and zip archives.
+
+This module reads the members of an archive one after another
+straight from the archive, nothing is extracted to the disk. A tar
+archive (compressed or not) is read as a stream from start to end,
+so it is never seeked in.
+"""
+
+import lzma
+import tarfile
+import zipfile
+import zlib
+
+# endings of the archive names, the rest of the files are C sources
+archive_extensions = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz', '.zip')
+# what a damaged archive raises, while being opened or while a member is being read
+archive_errors = (OSError, EOFError, tarfile.TarError, zipfile.BadZipFile, zlib.error, lzma.LZMAError)
+
+
+class ArchiveError(Exception):
+    """!
+    @brief The archive is not a valid archive or it is damaged.
+    """
+    pass
+
+
+def is_archive(filepath):
+    """!
+    @brief Tells an archive from a C source by its name.
+
+    @param filepath The path to the file.
+    @return Returns True for a tar or zip archive.
+    """
+    return filepath.lower().endswith(archive_extensions)
+
+
+def get_member_path(name):
+    """!
+    @brief Gets the path of a member relative to the archive.
+
+    @param name The name of the member as stored in the archive.
+    @return Returns the path separated by slashes, without a leading ./ or /.
+    """
+    parts = [part for part in name.replace('\\', '/').split('/') if part not in ('', '.')]
+    return '/'.join(parts)
+
+
+def iterate_members(filepath, is_member_read):
+    """!
+    @brief Reads the regular files of an archive.
+    Each of the members has to be read before the next one is
+    yielded, the members of a tar stream are gone afterwards. Any
+    of archive_errors is raised if the archive is damaged, reading
+    a member included.
+
+    @param filepath The path to the archive.
+    @param is_member_read The function telling, from the path of a member, whether it is read.
+    @return Yields tuples of the path of the member relative to the archive, its size and its file object.
+    """
+    ### ZIP ###
+    if filepath.lower().endswith('.zip'):
+        with zipfile.ZipFile(filepath) as zip_file:
+            for info in zip_file.infolist():
+                relpath = get_member_path(info.filename)
+                if info.is_dir() or not relpath or not is_member_read(relpath):
+                    continue
+                with zip_file.open(info) as member_handle:
+                    yield relpath, info.file_size, member_handle
+    ### END ZIP ###
+
+    ### TAR ###
+    else:
+        # the compression is told by the content
+        with tarfile.open(filepath, mode='r|*') as tar_file:
+            for info in tar_file:
+                relpath = get_member_path(info.name)
+                if not info.isfile() or not relpath or not is_member_read(relpath):
+                    continue
+                yield relpath, info.size, tar_file.extractfile(info)
+    ### END TAR ###
@@ -12,20 +12,56 @@ into a dictionary called args_dict.
 """
 
 import argparse
+import os
 import sys
+from archive import is_archive
 
 
 class Arguments:
-    args_dict = dict()
-    args_dict['input_file'] = None  # --input
-    args_dict['subdirs'] = None  # --nosubdir
-    args_dict['output_file'] = None  # --output
-    args_dict['all_keywords'] = False  # -k
-    args_dict['simp_ops'] = False  # -o
-    args_dict['identifiers'] = False  # -i
-    args_dict['word_search'] = None  # -w
-    args_dict['comments'] = False  # -c
-    args_dict['no_abs_path'] = False  # -p
+    def __init__(self):
+        """!
+        @brief Sets the default values of all the arguments.
+        """
+        self.args_dict = dict()
+        self.args_dict['input_file'] = None  # --input
+        self.args_dict['subdirs'] = None  # --nosubdir
+        self.args_dict['output_file'] = None  # --output
+        self.args_dict['all_keywords'] = False  # -k
+        self.args_dict['histogram'] = False  # --histogram
+        self.args_dict['simp_ops'] = False  # -o
+        self.args_dict['operator_histogram'] = False  # --operator-histogram
+        self.args_dict['identifiers'] = False  # -i
+        self.args_dict['word_search'] = None  # -w, --patterns-file
+        self.args_dict['comments'] = False  # -c
+        self.args_dict['no_abs_path'] = False  # -p
+        self.args_dict['jobs'] = 1  # --jobs
+        self.args_dict['cache_dir'] = None  # --cache
+        self.args_dict['cache_size'] = 100000  # --cache-size
+        self.args_dict['chunk_size'] = 1 << 20  # --chunk-size
+        self.args_dict['prefetch'] = 0  # --prefetch
+        self.args_dict['exclude'] = list()  # --exclude
+        self.args_dict['include'] = list()  # --include
+        self.args_dict['extensions'] = ['.c', '.h']  # --ext
+        self.args_dict['follow_symlinks'] = False  # --follow-symlinks
+        self.args_dict['watch'] = False  # --watch
+        self.args_dict['watch_interval'] = 1.0  # --watch-interval
+        self.args_dict['since'] = None  # --since
+        self.args_dict['baseline'] = None  # --baseline
+        self.args_dict['save_baseline'] = None  # --save-baseline
+        self.args_dict['format'] = 'text'  # --format
+        self.args_dict['sort'] = False  # --sort
+        self.args_dict['stats'] = None  # --stats
+        self.args_dict['stats_top'] = 10  # --stats-top
+        self.args_dict['profile'] = None  # --profile
+        self.args_dict['files_from'] = None  # --files-from
+        self.args_dict['stdin_source'] = None  # --stdin-source
+        self.args_dict['top_identifiers'] = None  # --top-identifiers
+        self.args_dict['top_capacity'] = 10000  # --top-capacity
+        self.args_dict['dedup'] = False  # --dedup
+        self.args_dict['serve'] = None  # --serve
+        self.args_dict['connect'] = None  # --connect
+        self.args_dict['shard'] = None  # --shard
+        self.args_dict['merge'] = None  # --merge
 
     def get_args(self):
         """!
@@ -39,11 +75,42 @@ class Arguments:
         parser.add_argument("--output", action="store")  # output file
         # OPTIONS
         parser.add_argument("-k", action="store_true")  # all keywords
+        parser.add_argument("--histogram", action="store_true")  # number of each of the keywords
         parser.add_argument("-o", action="store_true")  # simple operators
+        parser.add_argument("--operator-histogram", action="store_true")  # number of each of the operators
         parser.add_argument("-i", action="store_true")  # all operators, no keywords
-        parser.add_argument("-w", action="store")  # search pattern
+        parser.add_argument("-w", action="append")  # search pattern
+        parser.add_argument("--patterns-file", action="store")  # file of search patterns
         parser.add_argument("-c", action="store_true")  # comments
         parser.add_argument("-p", action="store_true")  # without absolute path
+        parser.add_argument("--jobs", action="store")  # number of worker processes
+        parser.add_argument("--cache", action="store")  # cache directory
+        parser.add_argument("--cache-size", action="store")  # maximum number of cached files
+        parser.add_argument("--chunk-size", action="store")  # bytes of a big file parsed at once
+        parser.add_argument("--prefetch", action="store")  # number of files read ahead
+        parser.add_argument("--exclude", action="append")  # globs of files/directories to skip
+        parser.add_argument("--include", action="append")  # globs of files to keep
+        parser.add_argument("--ext", action="store")  # extensions of the files to keep
+        parser.add_argument("--follow-symlinks", action="store_true")  # go into linked directories
+        parser.add_argument("--watch", action="store_true")  # keep recounting the changed files
+        parser.add_argument("--watch-interval", action="store")  # seconds between two checks for changes
+        parser.add_argument("--since", action="store")  # git commit to count the changes since
+        parser.add_argument("--baseline", action="store")  # records saved at the commit
+        parser.add_argument("--save-baseline", action="store")  # file to save the records into
+        parser.add_argument("--format", action="store")  # text, jsonl or csv
+        parser.add_argument("--sort", action="store_true")  # machine-readable records sorted by the filepath
+        parser.add_argument("--stats", nargs="?", const="-")  # time of each stage, to stderr or a JSON file
+        parser.add_argument("--stats-top", action="store")  # number of the slowest files listed
+        parser.add_argument("--profile", action="store")  # file to dump the cProfile data into
+        parser.add_argument("--files-from", action="store")  # file listing the files to count, - for stdin
+        parser.add_argument("--stdin-source", action="store")  # name of the file content piped in
+        parser.add_argument("--top-identifiers", action="store")  # number of the most frequent identifiers listed
+        parser.add_argument("--top-capacity", action="store")  # number of identifiers kept in memory
+        parser.add_argument("--dedup", action="store_true")  # count each of the contents only once
+        parser.add_argument("--serve", action="store")  # socket to answer the runs on
+        parser.add_argument("--connect", action="store")  # socket of the server to run on
+        parser.add_argument("--shard", action="store")  # part of the files to count, i/N
+        parser.add_argument("--merge", action="append")  # partial results to merge into the report
         parsed_args, unknown = parser.parse_known_args()
         # any unrecognized commands end in an error message
         if len(unknown) > 0:
@@ -57,9 +124,10 @@ class Arguments:
     def process_and_validate_args(self, args):
         """!
         @brief Validates and stores the user-side arguments.
-        Params -k, -o, -i, -w and -c cannot be combined, thus the
-        validation. Also, the argument values are stored into
-        a dictionary attribute of the class.
+        Params -k, -o, -i, -w and -c can be combined, each of them
+        adds a column to the output, but at least one of them has
+        to be passed, thus the validation. Also, the argument values
+        are stored into a dictionary attribute of the class.
 
         @param args The object returned by the ArgumentParser.parse_args() method.
         """
@@ -74,40 +142,261 @@ class Arguments:
             self.args_dict['output_file'] = args.output
         if args.k:
             self.args_dict['all_keywords'] = args.k
+        # the histogram comes with the keywords column
+        if args.histogram:
+            self.args_dict['histogram'] = args.histogram
+            self.args_dict['all_keywords'] = True
         if args.o:
             self.args_dict['simp_ops'] = args.o
+        # the histogram comes with the operators column
+        if args.operator_histogram:
+            self.args_dict['operator_histogram'] = args.operator_histogram
+            self.args_dict['simp_ops'] = True
         if args.i:
             self.args_dict['identifiers'] = args.i
+        patterns = list()
         if args.w:
-            self.args_dict['word_search'] = args.w
+            if '' in args.w:
+                sys.stderr.write('The pattern to search for cannot be empty.\n')
+                sys.exit(1)  # exit code 1 => invalid argument value
+            patterns.extend(args.w)
+        if args.patterns_file:
+            try:
+                with open(args.patterns_file, encoding='utf-8') as patterns_handle:
+                    # one pattern per line, empty lines are skipped
+                    patterns.extend([line.rstrip('\r\n') for line in patterns_handle if line.rstrip('\r\n')])
+            except (OSError, UnicodeDecodeError):
+                sys.stderr.write('The patterns file ' + args.patterns_file + ' cannot be read.\n')
+                sys.exit(2)  # exit code 2 => non-existent filepath
+        if patterns:
+            # each pattern only once, in the order passed
+            self.args_dict['word_search'] = list(dict.fromkeys(patterns))
         if args.c:
             self.args_dict['comments'] = args.c
         if args.p:
             self.args_dict['no_abs_path'] = args.p
+        if args.jobs:
+            if not args.jobs.isdigit():
+                sys.stderr.write('The number of jobs has to be a non-negative integer.\n')
+                sys.exit(1)  # exit code 1 => invalid argument value
+            # zero means one job for each CPU
+            self.args_dict['jobs'] = int(args.jobs) or os.cpu_count() or 1
+        if args.cache:
+            self.args_dict['cache_dir'] = args.cache
+        if args.cache_size:
+            if not args.cache_size.isdigit():
+                sys.stderr.write('The cache size has to be a non-negative integer.\n')
+                sys.exit(1)  # exit code 1 => invalid argument value
+            self.args_dict['cache_size'] = int(args.cache_size)
+        if args.chunk_size:
+            if not args.chunk_size.isdigit():
+                sys.stderr.write('The chunk size has to be a non-negative integer.\n')
+                sys.exit(1)  # exit code 1 => invalid argument value
+            self.args_dict['chunk_size'] = int(args.chunk_size)
+        if args.prefetch:
+            if not args.prefetch.isdigit():
+                sys.stderr.write('The number of the files read ahead has to be a non-negative integer.\n')
+                sys.exit(1)  # exit code 1 => invalid argument value
+            self.args_dict['prefetch'] = int(args.prefetch)
+        if args.exclude:
+            self.args_dict['exclude'] = args.exclude
+        if args.include:
+            self.args_dict['include'] = args.include
+        if args.ext:
+            extensions = [extension.strip() for extension in args.ext.split(',')]
+            if '' in extensions:
+                sys.stderr.write('The extensions have to be a comma-separated list (e.g. c,h).\n')
+                sys.exit(1)  # exit code 1 => invalid argument value
+            self.args_dict['extensions'] = ['.' + extension.lstrip('.') for extension in extensions]
+        if args.follow_symlinks:
+            self.args_dict['follow_symlinks'] = args.follow_symlinks
+        if args.watch:
+            self.args_dict['watch'] = args.watch
+        if args.watch_interval:
+            try:
+                self.args_dict['watch_interval'] = float(args.watch_interval)
+            except ValueError:
+                self.args_dict['watch_interval'] = 0
+            if not self.args_dict['watch_interval'] > 0:
+                sys.stderr.write('The watch interval has to be a positive number of seconds.\n')
+                sys.exit(1)  # exit code 1 => invalid argument value
+        if args.since:
+            self.args_dict['since'] = args.since
+        if args.baseline:
+            self.args_dict['baseline'] = args.baseline
+        if args.save_baseline:
+            self.args_dict['save_baseline'] = args.save_baseline
+        if args.format:
+            if args.format not in ('text', 'jsonl', 'csv'):
+                sys.stderr.write('The format has to be one of text, jsonl and csv.\n')
+                sys.exit(1)  # exit code 1 => invalid argument value
+            self.args_dict['format'] = args.format
+        if args.sort:
+            self.args_dict['sort'] = args.sort
+        if args.stats:
+            self.args_dict['stats'] = args.stats
+        if args.stats_top:
+            if not args.stats_top.isdigit():
+                sys.stderr.write('The number of the slowest files has to be a non-negative integer.\n')
+                sys.exit(1)  # exit code 1 => invalid argument value
+            self.args_dict['stats_top'] = int(args.stats_top)
+        if args.profile:
+            self.args_dict['profile'] = args.profile
+        if args.files_from:
+            self.args_dict['files_from'] = args.files_from
+        if args.stdin_source:
+            self.args_dict['stdin_source'] = args.stdin_source
+        # the identifiers listed come with the identifiers column
+        if args.top_identifiers:
+            if not args.top_identifiers.isdigit() or int(args.top_identifiers) == 0:
+                sys.stderr.write('The number of the top identifiers has to be a positive integer.\n')
+                sys.exit(1)  # exit code 1 => invalid argument value
+            self.args_dict['top_identifiers'] = int(args.top_identifiers)
+            self.args_dict['identifiers'] = True
+        if args.dedup:
+            self.args_dict['dedup'] = args.dedup
+        if args.top_capacity:
+            if not args.top_capacity.isdigit():
+                sys.stderr.write('The capacity of the top identifiers has to be a non-negative integer.\n')
+                sys.exit(1)  # exit code 1 => invalid argument value
+            self.args_dict['top_capacity'] = int(args.top_capacity)
+        if args.serve:
+            self.args_dict['serve'] = args.serve
+        if args.connect:
+            self.args_dict['connect'] = args.connect
+        if args.shard:
+            shard = args.shard.split('/')
+            if len(shard) != 2 or not shard[0].isdigit() or not shard[1].isdigit() or \
+                    not 1 <= int(shard[0]) <= int(shard[1]):
+                sys.stderr.write('The shard has to be passed as <i>/<n>, 1 <= i <= n.\n')
+                sys.exit(1)  # exit code 1 => invalid argument value
+            self.args_dict['shard'] = (int(shard[0]), int(shard[1]))
+        if args.merge:
+            self.args_dict['merge'] = args.merge
         ### END STORING ARGS ###
 
         ### VALIDATION ###
         boolVals = sum([self.args_dict['all_keywords'], self.args_dict['simp_ops'], self.args_dict['identifiers'],
                         self.args_dict['comments']])
-        if (boolVals > 1) or (boolVals == 1 and self.args_dict['word_search'] is not None):
-            sys.stderr.write('You have passed an invalid combination of arguments.\n'
-                             'Get help by passing the argument --help.\n')
-            sys.exit(1)  # exit code 1 => forbidden combination of arguments
+        if self.args_dict['serve'] is not None:
+            # the options come with each of the runs
+            if self.args_dict['connect'] is not None or self.args_dict['watch'] is True:
+                sys.stderr.write('--serve cannot be used with --connect and --watch.\n')
+                sys.exit(1)  # exit code 1 => forbidden combination of arguments
+            return
         if boolVals == 0 and self.args_dict['word_search'] is None:
             sys.stderr.write('No arguments passed. Get help by passing the argument --help.\n')
             sys.exit(1)  # exit code 1 => forbidden combination of arguments
+        if (self.args_dict['since'] is None) != (self.args_dict['baseline'] is None):
+            sys.stderr.write('--since and --baseline have to be passed together.\n')
+            sys.exit(1)  # exit code 1 => forbidden combination of arguments
+        inputs = [self.args_dict['input_file'], self.args_dict['files_from'], self.args_dict['stdin_source']]
+        if len(inputs) - inputs.count(None) > 1:
+            sys.stderr.write('Only one of --input, --files-from and --stdin-source can be passed.\n')
+            sys.exit(1)  # exit code 1 => forbidden combination of arguments
+        if inputs[0] is None and inputs != [None, None, None] and \
+                (self.args_dict['watch'] is True or self.args_dict['since'] is not None):
+            sys.stderr.write('--watch and --since need --input.\n')
+            sys.exit(1)  # exit code 1 => forbidden combination of arguments
+        if self.args_dict['top_identifiers'] is not None and \
+                (self.args_dict['watch'] is True or self.args_dict['since'] is not None):
+            sys.stderr.write('--top-identifiers cannot be used with --watch and --since.\n')
+            sys.exit(1)  # exit code 1 => forbidden combination of arguments
+        if self.args_dict['top_capacity'] != 0 and self.args_dict['top_identifiers'] is not None and \
+                self.args_dict['top_capacity'] < self.args_dict['top_identifiers']:
+            sys.stderr.write('The capacity of the top identifiers cannot be lower than their number.\n')
+            sys.exit(1)  # exit code 1 => forbidden combination of arguments
+        if self.args_dict['merge'] is not None and (inputs != [None, None, None] or self.args_dict['shard'] is not None):
+            sys.stderr.write('--merge cannot be used with --input, --files-from, --stdin-source and --shard.\n')
+            sys.exit(1)  # exit code 1 => forbidden combination of arguments
+        if (self.args_dict['merge'] is not None or self.args_dict['shard'] is not None) and \
+                (self.args_dict['watch'] is True or self.args_dict['since'] is not None or
+                 self.args_dict['save_baseline'] is not None or self.args_dict['stdin_source'] is not None):
+            sys.stderr.write('--shard and --merge cannot be used with --watch, --since, --save-baseline '
+                             'and --stdin-source.\n')
+            sys.exit(1)  # exit code 1 => forbidden combination of arguments
+        if self.args_dict['watch'] is True and self.args_dict['input_file'] is not None and \
+                is_archive(self.args_dict['input_file']):
+            sys.stderr.write('--watch cannot be used with an archive.\n')
+            sys.exit(1)  # exit code 1 => forbidden combination of arguments
         ### END VALIDATION ###
 
     def output_help(self):
         print("Usage:")
         print("--help " + "Prints the help statement.")
         print("--input=<fileordir> " + "Sets the input C file/dir to be checked.")
+        print("--input=<archive> " + "Reads the C files of a .tar, .tar.gz, .tgz, .tar.bz2, .tar.xz or .zip archive "
+              "straight from it (printed as <archive>/<path inside>), the options choosing the files of "
+              "a directory apply to the archive too.")
+        print("--files-from=<file> " + "Counts the files (or directories, archives) listed in <file> instead of "
+              "--input, one path per line or separated by NUL bytes, - reads the list from stdin as it comes.")
+        print("--stdin-source=<name> " + "Counts the file content piped in on stdin, printed as <name>.")
         print("--nosubdir " + "Do not go into subdirectories of the directory passed.")
         print("--output=<filename> " + "Sets the filename of the output file.")
         print("-k " + "Prints the number of keywords (in each source code and the total amount).")
+        print("--histogram " + "Implies -k, then also lists the number of each of the keywords in each file "
+              "and in total.")
         print("-o " + "Prints the number of simple operators (defined in the assignment).")
+        print("--operator-histogram " + "Implies -o, then also lists the number of each of the operators "
+              "(++, ->, <<=, ...) in each file and in total.")
         print("-i " + "Prints the number of identifiers (in each source code and the total amount).")
+        print("--top-identifiers=<n> " + "Implies -i, then also lists the <n> most frequent identifiers in each file "
+              "and in total.")
+        print("--top-capacity=<n> " + "Keeps the counts of at most <n> identifiers (10000 by default), the counts "
+              "are exact while there are not more different identifiers, otherwise they are estimates "
+              "(0 = always exact, with no limit on the memory). The counts of the identifiers are not cached.")
         print("-w=<pattern> " + "Searches for the exact string <pattern> in all source codes and prints the number of occurences.")
+        print("--patterns-file=<file> " + "Searches for each line of <file> as if passed by -w.")
+        print("-w and --patterns-file can be repeated/combined, the column then holds the number of occurrences "
+              "of all the patterns, each of them is then also listed in each file and in total.")
         print("-c " + "Prints the total number of comment characters including //, /* and */.")
+        print("--jobs=<n> " + "Spreads the files over <n> worker processes (0 = one for each CPU).")
+        print("--cache=<dir> " + "Keeps the counts of each file in <dir> and reuses them while the file does not change.")
+        print("--cache-size=<n> " + "Keeps at most <n> files in the cache, dropping the least recently used ones.")
+        print("--chunk-size=<n> " + "Reads and parses files bigger than <n> bytes in chunks of <n> bytes "
+              "(1 MiB by default, 0 = always the whole file at once).")
+        print("--prefetch=<n> " + "Reads up to <n> files ahead in as many threads while the previous ones are being "
+              "counted, so waiting for a slow disk or network file system overlaps with the parsing "
+              "(0 by default = off). The files read in chunks and the cached files are not read ahead.")
+        print("--exclude=<glob> " + "Skips the files and directories whose name or relative path matches <glob> "
+              "(can be repeated).")
+        print("--include=<glob> " + "Only counts the files whose name or relative path matches <glob> (can be repeated).")
+        print("--ext=<list> " + "Counts the files with the comma-separated extensions in <list> (c,h by default).")
+        print("--follow-symlinks " + "Goes into symbolically linked directories too (each directory only once).")
+        print("--watch " + "Keeps running after the report, recounts the files added, modified or deleted and "
+              "prints the report again after each batch of changes (stop it by Ctrl+C).")
+        print("--watch-interval=<seconds> " + "Checks the files for changes every <seconds> seconds (1 by default).")
+        print("--save-baseline=<file> " + "Saves the counts of all the files into <file>, to be used by --baseline later.")
+        print("--since=<ref> --baseline=<file> " + "Only counts the files git lists as changed since the commit <ref>, "
+              "takes the other files from <file> saved at <ref> (with the same options), then also lists "
+              "the change of each of the changed files and of the totals.")
+        print("--format=<format> " + "Prints the report as text (by default), as JSON Lines (jsonl) or as CSV (csv), "
+              "a record for each file, one for the totals and one for each change (--since), each telling "
+              "its kind (file, total, delta) and holding all the numbers counted.")
+        print("--sort " + "Writes the jsonl/csv records sorted by the filepath once all the files are counted "
+              "instead of as soon as each of them is (text is always sorted).")
+        print("--stats[=<file>] " + "Measures the wall time, CPU time and bytes processed by each stage (walking, "
+              "reading, lexing, each metric...), the slowest files and the peak memory, prints them to stderr "
+              "or saves them into the JSON <file>.")
+        print("--stats-top=<n> " + "Lists the <n> slowest files in the stats (10 by default).")
+        print("--profile=<file> " + "Dumps the cProfile data of the run (the main process) into <file>, "
+              "to be read by pstats.")
+        print("--dedup " + "Counts each of the file contents only once, the copies of a file get its numbers (the files "
+              "of the same size are hashed to find them, so all the files are listed before any is counted). "
+              "--stats tells how many copies were found.")
+        print("--serve=<socket> " + "Keeps running and answers the runs sent to the Unix <socket>, the counts of "
+              "the files stay in memory and are only counted again once the files change (--cache-size files at "
+              "most). The runs are answered one after another, each with a single job.")
+        print("--connect=<socket> " + "Sends the run (all the other options) to the server listening on <socket> "
+              "and prints what it answers. client.py does the same without loading the rest of the program.")
+        print("--shard=<i>/<n> " + "Only counts the files whose path hashes to the <i>-th of <n> shards and writes "
+              "their partial result (JSON) instead of the report. Each of the shards can be run on another machine, "
+              "with the same --input (or the same paths listed) and the same options.")
+        print("--merge=<file> " + "Prints the report of all the shards from their partial results instead of counting "
+              "any files, repeated for each of the <n> partial results. The options of the shards have to be passed "
+              "again, the report is then the same as that of a single run (streamed jsonl/csv records come shard by "
+              "shard, with --sort they are the same as well).")
+        print("Options -k, -o, -i, -w and -c can be combined, the file is then read only once and each of them "
+              "gets its own column (in the order -k, -o, -i, -w, -c).")
         print("-p " + "Combined with every option (except --help), prints the files without the absolute file path.")
         sys.exit(0)
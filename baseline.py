@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+#CST:xvitas02
+
+"""!
+@package baseline.py
+Results saved for an incremental run.
+
+This module saves the records of all the files counted into
+a baseline file and loads them back, so that a later run only
+has to count the files changed since (--since) and can take
+the records of all the other files from the baseline. The files
+changed are listed by git.
+"""
+
+import json
+import os
+import subprocess
+
+
+class Baseline:
+
+    def __init__(self, version):
+        """!
+        @brief Starts with no records.
+
+        @param version The version of the counting rules (Parser.version).
+        """
+        self.version = version
+        # relative filepath => record of occurrences
+        self.records = dict()
+
+    def load(self, filepath, keys):
+        """!
+        @brief Loads the records from a baseline file.
+
+        @param filepath The path to the baseline file.
+        @param keys The list of record keys the records have to hold.
+        @return Returns None if the records were loaded, the error message otherwise.
+        """
+        try:
+            with open(filepath, encoding='utf-8') as baseline_handle:
+                content = json.load(baseline_handle)
+        except (OSError, ValueError):
+            return 'The baseline ' + filepath + ' cannot be read.'
+        if not isinstance(content, dict) or not isinstance(content.get('records'), dict):
+            return 'The baseline ' + filepath + ' cannot be read.'
+        if content.get('version') != self.version:
+            return 'The baseline ' + filepath + ' was saved by a different version of the parser.'
+        for record in content['records'].values():
+            if False in [key in record for key in keys]:
+                return 'The baseline ' + filepath + ' does not hold all the counts requested.'
+        self.records = content['records']
+        return None
+
+    def save(self, filepath):
+        """!
+        @brief Saves the records into a baseline file.
+        The file is written under a temporary name first, so a run
+        interrupted halfway does not leave a broken baseline behind.
+
+        @param filepath The path to the baseline file.
+        """
+        temporary = filepath + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as baseline_handle:
+            json.dump({'version': self.version, 'records': self.records}, baseline_handle, sort_keys=True)
+        os.replace(temporary, filepath)
+
+
+def get_git_changes(directory, ref):
+    """!
+    @brief Lists the files changed since a commit.
+    Compares the commit with the working tree, so uncommitted
+    changes count as well, and adds the untracked files. A renamed
+    file is listed as deleted under the old path and added under
+    the new one.
+
+    @param directory The directory inside a git working tree.
+    @param ref The commit (branch, tag, hash) to compare with.
+    @return Returns the tuple of the list of the paths added or modified and the list of the paths deleted,
+    relative to the directory, or the error message (str) if git fails.
+    """
+    commands = [['git', 'diff', '--name-status', '-z', '--no-renames', '--relative', ref, '--'],
+                ['git', 'ls-files', '-z', '--others', '--exclude-standard']]
+    outputs = list()
+    for command in commands:
+        try:
+            process = subprocess.run(command, cwd=directory, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except OSError as error:
+            return 'git cannot be run: ' + str(error)
+        if process.returncode != 0:
+            return 'git failed: ' + process.stderr.decode(errors='replace').strip()
+        outputs.append(os.fsdecode(process.stdout).split('\0')[:-1])
+
+    ### CHANGES SINCE THE COMMIT ###
+    changed = list()
+    deleted = list()
+    diff = outputs[0]
+    for index in range(0, len(diff) - 1, 2):
+        if diff[index] == 'D':
+            deleted.append(diff[index + 1])
+        else:
+            changed.append(diff[index + 1])
+    ### END CHANGES SINCE THE COMMIT ###
+
+    # untracked files are new to the commit as well
+    changed.extend(outputs[1])
+    return changed, deleted
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+
+#CST:xvitas02
+
+"""!
+@package benchmark.py
+Measuring the speed of the parser.
+
+This script generates deterministic synthetic C corpora of
+several shapes, times each stage of the parsing over them as
+well as the whole command line run, and reports the speed in
+files/s and MB/s along with the peak memory of the command line
+run. The numbers can be saved as a baseline and later runs
+compared against it, so that a change making the parser slower
+or hungrier is caught. It is not a test, the numbers depend on
+the machine.
+
+    python3 benchmark.py --save=bench-baseline.json
+    python3 benchmark.py --baseline=bench-baseline.json > bench_output.txt
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from arguments import Arguments
+from parser import Parser
+
+# the chunk size of the command line run, the huge files are bigger, so they are read in chunks (count_stream)
+chunk_size = 1 << 20
+
+# name => (number of files, size of a file in bytes, share of comments, share of macros, directory depth)
+shapes = {
+    'small': (2000, 2 << 10, 0.1, 0.05, 2),
+    'huge': (2, 8 << 20, 0.1, 0.05, 0),
+    'comments': (200, 32 << 10, 0.6, 0.05, 1),
+    'macros': (200, 32 << 10, 0.1, 0.5, 1),
+    'deep': (1000, 4 << 10, 0.1, 0.05, 12),
+}
+
+# the command line run timed end to end
+cli_options = ['-k', '-o', '-i', '-w=int', '-c', '--chunk-size=' + str(chunk_size)]
+
+# runs cst.py and writes its peak memory in bytes to stderr, Linux keeps ru_maxrss of the parent
+# (the benchmark holding the corpus) across exec, so the peak of the process itself is read from /proc
+memory_probe = '''
+import atexit, os, resource, runpy, sys
+def report():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    if os.path.exists('/proc/self/status'):
+        peak = [int(line.split()[1]) * 1024 for line in open('/proc/self/status') if line.startswith('VmHWM:')][0]
+    sys.stderr.write('%d\\n' % peak)
+atexit.register(report)
+sys.argv = sys.argv[1:]
+sys.path.insert(0, os.path.dirname(sys.argv[0]))
+runpy.run_path(sys.argv[0], run_name='__main__')
+'''
+
+### SYNTHETIC C ###
+types = ['int', 'char', 'long', 'short', 'double', 'float', 'void', 'unsigned', 'const char', 'struct node']
+names = ['count', 'index', 'buffer', 'length', 'node', 'next', 'value', 'result', 'data', 'size', 'tmp', 'ptr']
+operators = ['+', '-', '*', '/', '%', '<<', '>>', '&', '|', '^', '&&', '||', '==', '!=', '<', '>', '<=', '>=']
+statements = [
+    '    {name} = {name} {op} {number};\n',
+    '    {type} *{name} = &{name};\n',
+    '    if ({name} {op} {number}) {{\n        {name}++;\n    }}\n',
+    '    for (int i = 0; i < {number}; i++) {{\n        {name}[i] = {name}->{name};\n    }}\n',
+    '    while ({name}-- > 0) {name} += sizeof({type});\n',
+    '    printf("{name} = %d, \\"{name}\\"\\n", {name});\n',
+    "    {name} = '{char}';\n",
+    '    return {name} {op} {name};\n',
+]
+# closing the previous function, main to begin with
+function = '}}\n\n{type} {name}_{number}({type} *{name}, int {name})\n{{\n'
+comments = [
+    '    // {name} is updated here, see {name}()\n',
+    '    /* {name}: the {name} of the {name} */\n',
+    '    /*\n     * {name} {name} {name}\n     * return {name};\n     */\n',
+]
+macros = [
+    '#define {upper} {number}\n',
+    '#define {upper}(a, b) \\\n    ((a) {op} (b))\n',
+    '#include <{name}.h>\n',
+    '#ifdef {upper}\n#undef {upper}\n#endif\n',
+]
+
+
+def generate_source(rng, size, comment_share, macro_share):
+    """!
+    @brief Generates the content of a C file.
+
+    @param rng The random.Random to draw from.
+    @param size The number of bytes to generate (roughly).
+    @param comment_share The share of the pieces which are comments.
+    @param macro_share The share of the pieces which are macros.
+    @return Returns the content (ASCII str).
+    """
+    pieces = list()
+    length = 0
+    while length < size:
+        name = rng.choice(names)
+        values = {'name': name, 'type': rng.choice(types), 'op': rng.choice(operators),
+                  'number': rng.randint(0, 1000), 'char': rng.choice('abcxyz'), 'upper': name.upper()}
+        draw = rng.random()
+        if draw < comment_share:
+            piece = rng.choice(comments)
+        elif draw < comment_share + macro_share:
+            piece = rng.choice(macros)
+        elif rng.random() < 0.1:
+            piece = function
+        else:
+            piece = rng.choice(statements)
+        # each name drawn again
+        while '{name}' in piece:
+            piece = piece.replace('{name}', rng.choice(names), 1)
+        piece = piece.format(**values)
+        pieces.append(piece)
+        length += len(piece)
+    return 'int main(void)\n{\n' + ''.join(pieces) + '}\n'
+
+
+def generate_corpus(directory, shape, seed):
+    """!
+    @brief Generates a corpus (unless it is generated already).
+    The same shape and seed always give the same files.
+
+    @param directory The directory to generate the corpus in.
+    @param shape The name of the shape (a key of shapes).
+    @param seed The seed of the random generator.
+    @return Returns the tuple of the number of files and their total size in bytes.
+    """
+    stamp = os.path.join(directory, '.stamp')
+    signature = json.dumps([shape, shapes[shape], seed])
+    if os.path.exists(stamp):
+        with open(stamp) as stamp_handle:
+            if stamp_handle.read() == signature:
+                return count_corpus(directory)
+
+    rng = random.Random(shape + ':' + str(seed))
+    number, size, comment_share, macro_share, depth = shapes[shape]
+    for index in range(number):
+        # spreading the files over a tree of the depth given
+        parts = ['d' + str(rng.randint(0, 3)) for level in range(rng.randint(0, depth) if depth else 0)]
+        path = os.path.join(directory, *(parts + ['f' + str(index) + rng.choice(['.c', '.h'])]))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='ascii', newline='') as source_handle:
+            source_handle.write(generate_source(rng, size, comment_share, macro_share))
+    with open(stamp, 'w') as stamp_handle:
+        stamp_handle.write(signature)
+    return count_corpus(directory)
+
+
+def count_corpus(directory):
+    """!
+    @brief Measures a corpus.
+
+    @param directory The directory of the corpus.
+    @return Returns the tuple of the number of files and their total size in bytes.
+    """
+    number = 0
+    size = 0
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            if name.endswith(('.c', '.h')):
+                number += 1
+                size += os.path.getsize(os.path.join(root, name))
+    return number, size
+### END SYNTHETIC C ###
+
+
+### STAGES ###
+def time_stage(function, repeat):
+    """!
+    @brief Times a stage.
+
+    @param function The function running the stage.
+    @param repeat The number of runs, the fastest one counts.
+    @return Returns the tuple of the seconds and what the last run returned.
+    """
+    best = None
+    for run in range(repeat):
+        start = time.perf_counter()
+        value = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, value
+
+
+def run_command(command):
+    """!
+    @brief Runs the command line with its peak memory measured.
+
+    @param command The arguments of cst.py, the path to it first.
+    @return Returns the peak resident set size of the run in bytes.
+    """
+    process = subprocess.run([sys.executable, '-c', memory_probe] + command, stdout=subprocess.DEVNULL,
+                             stderr=subprocess.PIPE, check=True)
+    return int(process.stderr.split()[-1])
+
+
+def read_files(filepaths):
+    """!
+    @brief Reads the files whole.
+
+    @param filepaths The list of filepaths.
+    @return Returns the list of the contents (bytes).
+    """
+    contents = list()
+    for filepath in filepaths:
+        with open(filepath, 'rb') as filehandle:
+            contents.append(filehandle.read())
+    return contents
+
+
+def count_metric(parser, metric, contents, views):
+    """!
+    @brief Counts a metric in the views prepared.
+
+    @param parser The Parser.
+    @param metric The metric key.
+    @param contents The list of the contents.
+    @param views The list of dictionaries of view => joined content, one for each content.
+    """
+    args_dict = Arguments().args_dict
+    if metric == 'word_search':
+        args_dict[metric] = ['int']
+    else:
+        args_dict[metric] = True
+    view = parser.metric_views[metric]
+    for data, joined in zip(contents, views):
+        counters = parser.get_counters(args_dict)
+        piece = data if view is None else joined[view]
+        for counter in counters[metric]:
+            counter.feed(piece, True)
+
+
+def run_stages(directory, repeat):
+    """!
+    @brief Times each of the stages over a corpus.
+    Each stage after reading works with the contents in memory
+    and with what the previous stages produced, so it is timed
+    on its own.
+
+    @param directory The directory of the corpus.
+    @param repeat The number of runs of each stage, the fastest one counts.
+    @return Returns the list of (stage, seconds) tuples and the peak memory of the command line run in bytes.
+    """
+    parser = Parser()
+    args_dict = Arguments().args_dict
+    lexer = parser.lexer
+    views = [parser.code_view, parser.keyword_view, parser.comment_view]
+    timings = list()
+
+    seconds, filepaths = time_stage(lambda: list(parser.walk_directory(directory, args_dict)), repeat)
+    timings.append(('walk', seconds))
+    seconds, contents = time_stage(lambda: read_files(filepaths), repeat)
+    timings.append(('read', seconds))
+    seconds, spans = time_stage(lambda: [lexer.get_spans(lexer.tokenize(data), views) for data in contents], repeat)
+    timings.append(('lex', seconds))
+    seconds, joined = time_stage(lambda: [dict([(view, lexer.join_spans(data, view_spans))
+                                                for view, view_spans in zip(views, file_spans)])
+                                          for data, file_spans in zip(contents, spans)], repeat)
+    timings.append(('views', seconds))
+    for metric in parser.metrics_list:
+        seconds, value = time_stage(lambda: count_metric(parser, metric, contents, joined), repeat)
+        timings.append((metric, seconds))
+
+    command = [os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cst.py'),
+               '--input=' + directory] + cli_options
+    seconds, peak = time_stage(lambda: run_command(command), repeat)
+    timings.append(('cli', seconds))
+    return timings, peak
+### END STAGES ###
+
+
+def compare(speeds, baseline, tolerance):
+    """!
+    @brief Compares the speeds and the peak memory with a baseline.
+
+    @param speeds The dictionary of shape => stage => MB/s, the 'peak' stage => MB of the command line run.
+    @param baseline The same dictionary saved earlier.
+    @param tolerance The share the speed may drop by (the peak may grow by) before it is a regression.
+    @return Returns the list of the lines describing the regressions.
+    """
+    regressions = list()
+    for shape in speeds:
+        for stage, speed in speeds[shape].items():
+            old_speed = baseline.get(shape, dict()).get(stage)
+            if stage == 'peak':
+                if old_speed and speed > old_speed * (1 + tolerance):
+                    regressions.append('%s cli peak: %.1f MB, %.1f MB in the baseline (%+.0f %%)' %
+                                       (shape, speed, old_speed, (speed / old_speed - 1) * 100))
+            elif old_speed and speed < old_speed * (1 - tolerance):
+                regressions.append('%s %s: %.1f MB/s, %.1f MB/s in the baseline (%+.0f %%)' %
+                                   (shape, stage, speed, old_speed, (speed / old_speed - 1) * 100))
+    return regressions
+
+
+def main():
+    """!
+    @brief Generates the corpora, times the stages and reports the speeds.
+    """
+    parser = argparse.ArgumentParser(description='Measures the speed and the memory of the parser over synthetic C '
+                                                 'corpora.')
+    parser.add_argument('--corpus', help='directory to generate the corpora in (a temporary one by default)')
+    parser.add_argument('--shapes', default=','.join(shapes), help='comma-separated shapes of the corpora (%(default)s)')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the generated corpora (%(default)s)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each stage, the fastest counts (%(default)s)')
+    parser.add_argument('--save', help='file to save the speeds and the peaks into as a baseline')
+    parser.add_argument('--baseline', help='file of the speeds and the peaks to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='share the speed may drop by (the peak may grow by) before it is a regression '
+                             '(%(default)s)')
+    args = parser.parse_args()
+    selected = args.shapes.split(',')
+    for shape in selected:
+        if shape not in shapes:
+            parser.error('unknown shape ' + shape + ', choose from ' + ', '.join(shapes))
+
+    temporary = None
+    if args.corpus is None:
+        temporary = tempfile.TemporaryDirectory(prefix='cst-bench-')
+        args.corpus = temporary.name
+
+    speeds = dict()
+    for shape in selected:
+        directory = os.path.join(args.corpus, shape)
+        number, size = generate_corpus(directory, shape, args.seed)
+        print('%s: %d files, %.1f MB' % (shape, number, size / 1e6))
+        speeds[shape] = dict()
+        timings, peak = run_stages(directory, args.repeat)
+        for stage, seconds in timings:
+            speeds[shape][stage] = size / 1e6 / seconds
+            print('  %-14s %9.3f s %12.0f files/s %9.1f MB/s' % (stage, seconds, number / seconds,
+                                                                  speeds[shape][stage]))
+        speeds[shape]['peak'] = peak / 1e6
+        print('  %-14s %9.1f MB' % ('cli peak', speeds[shape]['peak']))
+        sys.stdout.flush()
+    if temporary is not None:
+        temporary.cleanup()
+
+    if args.save is not None:
+        with open(args.save, 'w') as baseline_handle:
+            json.dump(speeds, baseline_handle, indent=1, sort_keys=True)
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_handle:
+            regressions = compare(speeds, json.load(baseline_handle), args.tolerance)
+        for line in regressions:
+            print('REGRESSION ' + line)
+        if regressions:
+            sys.exit(1)
+        print('no regressions against ' + args.baseline)
+
+##########################
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+#CST:xvitas02
+
+"""!
+@package cache.py
+Persistent cache of the per-file results.
+
+This module stores the number of occurrences found in each
+file in an SQLite database inside a cache directory, so that
+files which did not change since the last run do not have to
+be read and parsed again. A server (--serve) keeps them in
+memory instead.
+"""
+
+import collections
+import hashlib
+import os
+import sqlite3
+import time
+
+
+class Cache:
+    # name of the database inside the cache directory
+    database_name = 'cst-cache.sqlite'
+    # seconds to wait for a lock held by another run
+    timeout = 60
+    # number of changes written at once
+    commit_every = 256
+
+    def __init__(self, directory, signature, max_entries):
+        """!
+        @brief Opens (and creates) the cache.
+        Opens the database in the directory passed, the whole content
+        is thrown away if it was written by a different version of
+        the parser or with a different list of keywords.
+
+        @param directory The cache directory.
+        @param signature The string identifying the parser version and the keywords.
+        @param max_entries The maximum number of files kept in the cache.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.max_entries = max_entries
+        self.pending = 0
+        self.connection = sqlite3.connect(os.path.join(directory, self.database_name), timeout=self.timeout)
+        # write-ahead log lets parallel runs read while one of them writes
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, '
+                                    'mtime_ns INTEGER, inode INTEGER, digest TEXT, last_used REAL)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS counts (digest TEXT, metric TEXT, number INTEGER, '
+                                    'PRIMARY KEY (digest, metric))')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS files_last_used ON files (last_used)')
+            row = self.connection.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+            # invalidating everything written by a different parser
+            if row is None or row[0] != signature:
+                self.connection.execute('DELETE FROM files')
+                self.connection.execute('DELETE FROM counts')
+                self.connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('signature', ?)",
+                                        (signature,))
+
+    def get_digest(self, filepath, stat):
+        """!
+        @brief Gets the content hash of an unchanged file.
+        The file is considered unchanged if its size, modification
+        time and inode are the same as when it was cached.
+
+        @param filepath The absolute path to the file.
+        @param stat The result of os.stat of the file.
+        @return Returns the content hash or None if the file is not cached or changed.
+        """
+        row = self.connection.execute('SELECT size, mtime_ns, inode, digest FROM files WHERE path = ?',
+                                      (filepath,)).fetchone()
+        if row is None or tuple(row[:3]) != (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+            return None
+        return row[3]
+
+    def get_counts(self, digest, metrics):
+        """!
+        @brief Gets the cached counts of a content.
+
+        @param digest The content hash.
+        @param metrics The list of cache keys of the metrics needed.
+        @return Returns the dictionary of cache key => number, None unless all the metrics are cached.
+        """
+        rows = self.connection.execute('SELECT metric, number FROM counts WHERE digest = ?',
+                                       (digest,)).fetchall()
+        found = dict(rows)
+        if False in [metric in found for metric in metrics]:
+            return None
+        return found
+
+    def put(self, filepath, stat, digest, counts=None):
+        """!
+        @brief Stores a file (and the counts of its content).
+
+        @param filepath The absolute path to the file.
+        @param stat The result of os.stat of the file.
+        @param digest The content hash.
+        @param counts The dictionary of cache key => number to store, None to only refresh the file.
+        """
+        self.connection.execute('INSERT OR REPLACE INTO files (path, size, mtime_ns, inode, digest, last_used) '
+                                'VALUES (?, ?, ?, ?, ?, ?)',
+                                (filepath, stat.st_size, stat.st_mtime_ns, stat.st_ino, digest, time.time()))
+        if counts is not None:
+            self.connection.executemany('INSERT OR REPLACE INTO counts (digest, metric, number) VALUES (?, ?, ?)',
+                                        [(digest, metric, number) for metric, number in counts.items()])
+        self.changed()
+
+    def touch(self, filepath):
+        """!
+        @brief Marks a cached file as recently used.
+
+        @param filepath The absolute path to the file.
+        """
+        self.connection.execute('UPDATE files SET last_used = ? WHERE path = ?', (time.time(), filepath))
+        self.changed()
+
+    def changed(self):
+        """!
+        @brief Commits the changes once in a while.
+        Committing after every file would make parallel runs wait
+        for each other all the time.
+        """
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.connection.commit()
+            self.pending = 0
+
+    def evict(self):
+        """!
+        @brief Removes the least recently used files over the limit.
+        Counts no longer referenced by any file are removed too.
+        """
+        with self.connection:
+            self.connection.execute('DELETE FROM files WHERE path IN (SELECT path FROM files '
+                                    'ORDER BY last_used DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+            self.connection.execute('DELETE FROM counts WHERE digest NOT IN (SELECT digest FROM files)')
+
+    def close(self):
+        """!
+        @brief Commits the remaining changes and closes the database.
+        """
+        self.connection.commit()
+        self.connection.close()
+
+
+def get_content_digest(data):
+    """!
+    @brief Hashes the content of a file.
+
+    @param data The bytes read from the file.
+    @return Returns the hexadecimal digest.
+    """
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def get_file_digest(filehandle, chunk_size):
+    """!
+    @brief Hashes the content of a file without reading it whole.
+
+    @param filehandle The file opened in binary mode.
+    @param chunk_size The number of bytes read at once.
+    @return Returns the hexadecimal digest (the same as get_content_digest of the whole content).
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    chunk = filehandle.read(chunk_size)
+    while chunk:
+        digest.update(chunk)
+        chunk = filehandle.read(chunk_size)
+    return digest.hexdigest()
+
+
+class MemoryCache:
+
+    def __init__(self, max_entries):
+        """!
+        @brief Starts with nothing cached.
+        Keeps the counts in memory for the life of a server (--serve),
+        it is used the same way as the Cache.
+
+        @param max_entries The maximum number of files kept in the cache.
+        """
+        self.max_entries = max_entries
+        # absolute filepath => (size, modification time, inode, digest), the least recently used first
+        self.files = collections.OrderedDict()
+        # digest => dictionary of cache key => number
+        self.counts = dict()
+
+    def get_digest(self, filepath, stat):
+        """!
+        @brief Gets the content hash of an unchanged file.
+
+        @param filepath The absolute path to the file.
+        @param stat The result of os.stat of the file.
+        @return Returns the content hash or None if the file is not cached or changed.
+        """
+        entry = self.files.get(filepath)
+        if entry is None or entry[:3] != (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+            return None
+        return entry[3]
+
+    def get_counts(self, digest, metrics):
+        """!
+        @brief Gets the cached counts of a content.
+
+        @param digest The content hash.
+        @param metrics The list of cache keys of the metrics needed.
+        @return Returns the dictionary of cache key => number, None unless all the metrics are cached.
+        """
+        found = self.counts.get(digest)
+        if found is None or False in [metric in found for metric in metrics]:
+            return None
+        return found
+
+    def put(self, filepath, stat, digest, counts=None):
+        """!
+        @brief Stores a file (and the counts of its content).
+
+        @param filepath The absolute path to the file.
+        @param stat The result of os.stat of the file.
+        @param digest The content hash.
+        @param counts The dictionary of cache key => number to store, None to only refresh the file.
+        """
+        self.files[filepath] = (stat.st_size, stat.st_mtime_ns, stat.st_ino, digest)
+        self.files.move_to_end(filepath)
+        if counts is not None:
+            self.counts.setdefault(digest, dict()).update(counts)
+
+    def touch(self, filepath):
+        """!
+        @brief Marks a cached file as recently used.
+
+        @param filepath The absolute path to the file.
+        """
+        self.files.move_to_end(filepath)
+
+    def evict(self):
+        """!
+        @brief Removes the least recently used files over the limit.
+        Counts no longer referenced by any file are removed too.
+        """
+        if len(self.files) <= self.max_entries:
+            return
+        while len(self.files) > self.max_entries:
+            self.files.popitem(last=False)
+        used = set([entry[3] for entry in self.files.values()])
+        self.counts = dict([(digest, counts) for digest, counts in self.counts.items() if digest in used])
+
+    def close(self):
+        """!
+        @brief Keeps everything, the cache lives as long as the server.
+        """
+        pass
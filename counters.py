@@ -0,0 +1,670 @@
+#!/usr/bin/env python3
+
+#CST:xvitas02
+
+"""!
+@package counters.py
+Counting the matches over a content fed in chunks.
+
+Each of the counters gets the content (or one of its views)
+in consecutive pieces and counts exactly what matching the
+whole content at once would, keeping only the few bytes at the
+end of a piece that the next one could still change.
+"""
+
+import abc
+import collections
+import re
+
+
+class Counter(abc.ABC):
+    # number of bytes a match needs to be seen after its start to be recognised
+    margin = 0
+    # number of bytes before the start of a scan seen by the lookbehinds
+    context = 0
+
+    def __init__(self):
+        """!
+        @brief Starts with nothing counted.
+        """
+        self.number = 0
+        # the bytes carried over from the previous piece and where to go on in them
+        self.buffer = b''
+        self.position = 0
+        # offset of the buffer from the start of the content
+        self.offset = 0
+
+    def feed(self, data, final=False):
+        """!
+        @brief Counts the matches in the next piece of the content.
+        The part of the piece which cannot be decided yet is kept
+        and scanned again together with the next piece.
+
+        @param data The next piece of the content (bytes-like).
+        @param final Whether this is the last piece of the content.
+        """
+        carried = len(self.buffer) > 0
+        if carried:
+            self.buffer += data
+            data = self.buffer
+        limit = len(data) if final else self.get_limit(data)
+        position = self.scan(data, limit, final)
+        if final:
+            self.buffer = b''
+            self.position = 0
+            self.offset = 0
+            return
+        keep = max(position - self.context, 0)
+        if carried:
+            # dropping the start of a bytearray does not copy the rest
+            del self.buffer[:keep]
+        else:
+            self.buffer = bytearray(data[keep:])
+        self.position = position - keep
+        self.offset += keep
+
+    def get_number(self):
+        """!
+        @brief Gets the number of matches counted so far.
+
+        @return Returns the number of matches (or bytes matched).
+        """
+        return self.number
+
+    def get_numbers(self):
+        """!
+        @brief Gets the numbers counted so far, one for each of the things counted.
+
+        @return Returns the list of numbers.
+        """
+        return [self.get_number()]
+
+    def get_limit(self, data):
+        """!
+        @brief Finds where the matches cannot be decided yet.
+
+        @param data The content carried over and the next piece.
+        @return Returns the offset no match starting before depends on the bytes still to come.
+        """
+        return max(len(data) - self.margin, self.position)
+
+    @abc.abstractmethod
+    def scan(self, data, limit, final):
+        """!
+        @brief Counts the matches starting before the limit.
+
+        @param data The content carried over and the next piece.
+        @param limit The offset returned by get_limit (the end of the content if final).
+        @param final Whether this is the last piece of the content.
+        @return Returns the offset to go on from with the next piece.
+        """
+
+
+class RegexCounter(Counter):
+    # number of bytes whose matches find_windows lists at once, up to a whitespace byte
+    window = 1 << 16
+    window_end = re.compile(rb'\s')
+
+    def __init__(self, regex, margin, run=None, windowed=False):
+        """!
+        @brief Counts the matches of a regex.
+
+        @param regex The compiled bytes regex, looking at most one byte behind a match.
+        @param margin The longest bounded match (and what it looks ahead at).
+        @param run The bytes an unbounded match is made of, None if the matches are bounded.
+        @param windowed Whether no match takes a whitespace byte and the regex looks at most one byte ahead,
+        so the matches can be listed a window at a time.
+        """
+        Counter.__init__(self)
+        self.regex = regex
+        self.margin = margin
+        self.context = 1
+        self.run = run
+        self.windowed = windowed
+        # offsets from the start of the content: how far get_limit has looked
+        # and where the run of bytes at the end of what it looked at starts
+        self.seen = 0
+        self.trailing = 0
+
+    def feed(self, data, final=False):
+        """!
+        @brief Counts the matches in the next piece of the content.
+
+        @param data The next piece of the content (bytes-like).
+        @param final Whether this is the last piece of the content.
+        """
+        Counter.feed(self, data, final)
+        if final:
+            self.seen = 0
+            self.trailing = 0
+
+    def get_limit(self, data):
+        """!
+        @brief Finds where the matches cannot be decided yet.
+        A match starting in the run of bytes at the end of the content
+        could still go on in the next piece, so the limit is moved back
+        to where the run starts. Only the bytes fed since the last call
+        are looked at, a run carried over is not read again.
+
+        @param data The content carried over and the next piece.
+        @return Returns the offset no match starting before depends on the bytes still to come.
+        """
+        limit = Counter.get_limit(self, data)
+        if self.run is not None:
+            seen = self.seen - self.offset
+            stripped = len(data[seen:].rstrip(self.run))
+            if stripped:
+                self.trailing = self.offset + seen + stripped
+            self.seen = self.offset + len(data)
+            limit = min(limit, self.trailing - self.offset)
+        return max(limit, self.position)
+
+    def find_matches(self, data, position, limit):
+        """!
+        @brief Finds the matches starting before the limit.
+        The run at the end of the content is left out of the search,
+        no match starting before the limit gets into it, so a long
+        undecided match is not read again with each of the pieces.
+
+        @param data The content carried over and the next piece.
+        @param position The offset to start from.
+        @param limit The offset returned by get_limit.
+        @return Yields the match objects.
+        """
+        end = len(data)
+        if self.run is not None:
+            end = max(self.trailing - self.offset, limit)
+        for match in self.regex.finditer(data, position, end):
+            if match.start() >= limit:
+                break
+            yield match
+
+    def find_windows(self, data, position, end):
+        """!
+        @brief Finds all the matches between two offsets, a window at a time.
+        The list of all the matches of a big content would take several
+        times more memory than the content. A window ends after a
+        whitespace byte, which does not change the matches of a windowed
+        regex.
+
+        @param data The content.
+        @param position The offset to start from.
+        @param end The offset to stop at (the end of the content or right after a whitespace byte).
+        @return Yields the lists returned by findall for each of the windows.
+        """
+        while position < end:
+            found = self.window_end.search(data, position + self.window, end)
+            stop = end if found is None else found.end()
+            yield self.regex.findall(data, position, stop)
+            position = stop
+
+    def count_all(self, data, position, end):
+        """!
+        @brief Counts all the matches between two offsets.
+        The matches of a windowed regex are listed a window at a time,
+        the others are gone through one by one.
+
+        @param data The content.
+        @param position The offset to start from.
+        @param end The offset to stop at (the end of the content or right after a whitespace byte).
+        """
+        if self.windowed:
+            for found in self.find_windows(data, position, end):
+                self.number += len(found)
+        else:
+            for match in self.regex.finditer(data, position, end):
+                self.number += 1
+
+    def count_match(self, match):
+        """!
+        @brief Counts a match found on its own.
+
+        @param match The match object.
+        """
+        self.number += 1
+
+    def scan(self, data, limit, final):
+        """!
+        @brief Counts the matches starting before the limit.
+
+        @param data The content carried over and the next piece.
+        @param limit The offset returned by get_limit (the end of the content if final).
+        @param final Whether this is the last piece of the content.
+        @return Returns the offset to go on from with the next piece.
+        """
+        position = self.position
+        if final:
+            self.count_all(data, position, len(data))
+            return len(data)
+        if self.windowed:
+            # the matches up to the last space or newline before the limit all at once
+            cut = max(data.rfind(b' ', position, limit), data.rfind(b'\n', position, limit)) + 1
+            if cut > position:
+                self.count_all(data, position, cut)
+                position = cut
+        for match in self.find_matches(data, position, limit):
+            position = match.end()
+            self.count_match(match)
+        return max(position, limit)
+
+
+class WordCounter(RegexCounter):
+
+    def __init__(self, regex, run, keywords, histogram, words=None):
+        """!
+        @brief Counts the words matched by a regex, telling the keywords apart.
+        Each of the words is looked up in the set of keywords, the
+        keywords are counted one by one, the other words together.
+
+        @param regex The compiled bytes regex matching whole words, looking at most one byte around a match.
+        @param run The bytes a word is made of.
+        @param keywords The frozenset of the keywords.
+        @param histogram True – the number is the number of keywords/False – the number of the other words
+        @param words The sketch.TopCounter to count each of the other words in, None not to.
+        """
+        RegexCounter.__init__(self, regex, 1, run, True)
+        self.keywords = keywords
+        # number of occurrences of each of the keywords
+        self.histogram = dict([(keyword, 0) for keyword in keywords])
+        self.is_histogram = histogram
+        self.words = words
+
+    def get_number(self):
+        """!
+        @brief Gets the number of words counted so far.
+
+        @return Returns the number of keywords or of the other words.
+        """
+        if self.is_histogram is True:
+            return sum(self.histogram.values())
+        return self.number
+
+    def count_all(self, data, position, end):
+        """!
+        @brief Counts all the words between two offsets.
+        The words are listed first and only counted afterwards.
+
+        @param data The content.
+        @param position The offset to start from.
+        @param end The offset to stop at (the end of the content or right after a whitespace byte).
+        """
+        words = collections.Counter()
+        for found in self.find_windows(data, position, end):
+            words.update(found)
+        found = 0
+        for keyword in self.keywords:
+            if keyword in words:
+                self.histogram[keyword] += words[keyword]
+                found += words[keyword]
+        self.number += sum(words.values()) - found
+        if self.words is not None:
+            for keyword in self.keywords:
+                words.pop(keyword, None)
+            self.words.update(words)
+
+    def count_match(self, match):
+        """!
+        @brief Counts a word found on its own.
+
+        @param match The match object of the word.
+        """
+        word = match.group()
+        if word in self.keywords:
+            self.histogram[word] += 1
+        else:
+            self.number += 1
+            if self.words is not None:
+                self.words.add(word)
+
+
+class TokenCounter(RegexCounter):
+
+    def __init__(self, regex, margin, tokens):
+        """!
+        @brief Counts the matches of a regex, each of the tokens on its own.
+
+        @param regex The compiled bytes regex matching the tokens (the whole match in its only group),
+        a windowed one (see RegexCounter).
+        @param margin The longest match (and what it looks ahead at).
+        @param tokens The list of all the tokens (bytes) the regex matches.
+        """
+        RegexCounter.__init__(self, regex, margin, None, True)
+        # number of occurrences of each of the tokens
+        self.histogram = dict([(token, 0) for token in tokens])
+
+    def get_number(self):
+        """!
+        @brief Gets the number of matches counted so far.
+
+        @return Returns the number of all the tokens.
+        """
+        return sum(self.histogram.values())
+
+    def count_all(self, data, position, end):
+        """!
+        @brief Counts all the tokens between two offsets.
+
+        @param data The content.
+        @param position The offset to start from.
+        @param end The offset to stop at (the end of the content or right after a whitespace byte).
+        """
+        for found in self.find_windows(data, position, end):
+            for token, number in collections.Counter(found).items():
+                self.histogram[token] += number
+
+    def count_match(self, match):
+        """!
+        @brief Counts a token found on its own.
+
+        @param match The match object of the token.
+        """
+        self.histogram[match.group(1)] += 1
+
+
+class PatternCounter(Counter):
+
+    def __init__(self, patterns, word_class, word_regex):
+        """!
+        @brief Counts the occurrences of many words/strings at once.
+        Each of the patterns is counted as if searched for on its own,
+        i.e. as a whole word (see Parser.get_search_regex). The patterns
+        made of word characters only are whole words of the content,
+        so all the words are simply looked up in a set of them. The
+        other patterns are put into a trie walked from each of the
+        places one of them can start at, which a single regex finds.
+
+        @param patterns The list of the patterns (bytes, None for a pattern that cannot occur).
+        @param word_class The bytes regex class standing for \\w.
+        @param word_regex The compiled bytes regex matching whole words.
+        """
+        Counter.__init__(self)
+        self.context = 1
+        self.patterns = patterns
+        word_run = b''.join(re.findall(word_class, bytes(range(256))))
+        self.is_word = [byte in word_run for byte in range(256)]
+        words = frozenset([pattern for pattern in patterns if pattern and not pattern.strip(word_run)])
+        self.words = WordCounter(word_regex, word_run, words, True) if words else None
+
+        ### TRIE ###
+        # each node maps the next byte to a node, the key None of a node
+        # ending a pattern holds its index and whether it ends with a word character
+        self.trie = dict()
+        self.numbers = [0 for pattern in patterns]
+        # where the last occurrence counted ends, the next one of the same pattern cannot overlap it
+        self.ends = [0 for pattern in patterns]
+        word_starts = set()
+        other_starts = set()
+        for index, pattern in enumerate(patterns):
+            if not pattern or pattern in words:
+                continue
+            node = self.trie
+            for byte in pattern:
+                node = node.setdefault(byte, dict())
+            node[None] = (index, self.is_word[pattern[-1]])
+            self.margin = max(self.margin, len(pattern) + 1)
+            if self.is_word[pattern[0]]:
+                word_starts.add(pattern[0])
+            else:
+                other_starts.add(pattern[0])
+        ### END TRIE ###
+
+        # a word starts after a non-word character, anything else right after a word character
+        starts = list()
+        if word_starts:
+            starts.append(b'(?<!' + word_class + b')' + self.get_byte_set(word_starts))
+        if other_starts:
+            starts.append(b'(?<=' + word_class + b')' + self.get_byte_set(other_starts))
+        self.starts = re.compile(b'|'.join(starts)) if starts else None
+
+    def get_byte_set(self, members):
+        """!
+        @brief Makes a bytes regex class.
+
+        @param members The set of the bytes (integers) in the class.
+        @return Returns the bytes regex class.
+        """
+        return b'[' + b''.join([re.escape(bytes([byte])) for byte in sorted(members)]) + b']'
+
+    def feed(self, data, final=False):
+        """!
+        @brief Counts the occurrences in the next piece of the content.
+
+        @param data The next piece of the content (bytes-like).
+        @param final Whether this is the last piece of the content.
+        """
+        if self.words is not None:
+            self.words.feed(data, final)
+        if self.starts is not None:
+            Counter.feed(self, data, final)
+
+    def get_number(self):
+        """!
+        @brief Gets the number of occurrences counted so far.
+
+        @return Returns the number of occurrences of all the patterns.
+        """
+        return sum(self.get_numbers())
+
+    def get_numbers(self):
+        """!
+        @brief Gets the numbers of occurrences counted so far.
+
+        @return Returns the list of numbers, one for each of the patterns.
+        """
+        histogram = self.words.histogram if self.words is not None else dict()
+        return [histogram[pattern] if pattern in histogram else number
+                for pattern, number in zip(self.patterns, self.numbers)]
+
+    def scan(self, data, limit, final):
+        """!
+        @brief Counts the occurrences starting before the limit.
+
+        @param data The content carried over and the next piece.
+        @param limit The offset returned by get_limit (the end of the content if final).
+        @param final Whether this is the last piece of the content.
+        @return Returns the offset to go on from with the next piece.
+        """
+        trie = self.trie
+        is_word = self.is_word
+        numbers = self.numbers
+        ends = self.ends
+        offset = self.offset
+        length = len(data)
+        for found in self.starts.finditer(data, self.position):
+            start = found.start()
+            if start >= limit:
+                break
+            node = trie
+            index = start
+            while index < length:
+                node = node.get(data[index])
+                if node is None:
+                    break
+                index += 1
+                if None in node:
+                    pattern, word_end = node[None]
+                    # a word ends before a non-word character, anything else right before a word character
+                    if index < length:
+                        bounded = is_word[data[index]] is not word_end
+                    else:
+                        bounded = word_end
+                    if bounded and offset + start >= ends[pattern]:
+                        numbers[pattern] += 1
+                        ends[pattern] = offset + index
+        return max(self.position, limit)
+
+
+class DeclaratorFilter(RegexCounter):
+
+    def __init__(self, starts, declarator, gap, margin, target):
+        """!
+        @brief Removes the declarators following the matches of a regex.
+        The declarators right after each of the matches of starts
+        (a type name) are matched one at a time, each of them has to
+        take at least one byte and none of them is ever matched again
+        another way. The bytes of the content are thus looked at a
+        bounded number of times, whatever the content is, unlike with
+        a repeated group matching all of them at once. The content
+        with the declarators removed (the matches of starts kept) is
+        passed on to the target counter.
+
+        @param starts The compiled bytes regex matching where the declarators can start (looking one byte behind).
+        @param declarator The compiled bytes regex matching a single declarator (never empty).
+        @param gap The compiled bytes regex matching what a declarator can take before its first star.
+        @param margin The longest match of starts (and what it looks ahead at).
+        @param target The counter to pass the content on to.
+        """
+        RegexCounter.__init__(self, starts, margin)
+        self.declarator = declarator
+        self.gap = gap
+        self.target = target
+
+    def get_number(self):
+        """!
+        @brief Gets the number of matches counted so far.
+
+        @return Returns the number counted by the target counter.
+        """
+        return self.target.get_number()
+
+    def scan(self, data, limit, final):
+        """!
+        @brief Removes the declarators following the matches starting before the limit.
+        Unless the content is final, the declarators following a match
+        are only removed if the bytes after them already show no other
+        declarator follows (a declarator ending before the end of the
+        content, the gap before the next star ending before a byte
+        other than a star). Otherwise the scan stops at the match and
+        goes on from it with the next piece.
+
+        @param data The content carried over and the next piece.
+        @param limit The offset returned by get_limit (the end of the content if final).
+        @param final Whether this is the last piece of the content.
+        @return Returns the offset to go on from with the next piece.
+        """
+        position = self.position
+        # the bytes kept, copied straight away (a slice object for each of them would take more)
+        kept = bytearray()
+        view = memoryview(data)
+        length = len(data)
+        end = position
+        while True:
+            found = self.regex.search(data, end)
+            if found is None or found.start() >= limit:
+                break
+            end = found.end()
+            stop = end
+            declarator = self.declarator.match(data, stop)
+            while declarator is not None and (final or declarator.end() < length):
+                stop = declarator.end()
+                declarator = self.declarator.match(data, stop)
+            if not final and (declarator is not None or self.gap.match(data, stop).end() == length):
+                # the declarators may go on in the next piece
+                limit = found.start()
+                break
+            if stop == end:
+                continue
+            kept += view[position:end]
+            position = end = stop
+        end = max(position, limit)
+        if position == 0 and end == length:
+            # nothing removed, no need to copy the content
+            view.release()
+            self.target.feed(data, final)
+            return end
+        kept += view[position:end]
+        view.release()
+        self.target.feed(kept, final)
+        return end
+
+
+class InlineCommentCounter(Counter):
+    # the second slash of a comment may be in the next piece
+    margin = 1
+
+    def __init__(self):
+        """!
+        @brief Counts the bytes of the inline comments (// up to and including the newline).
+        """
+        Counter.__init__(self)
+        self.inside = False
+
+    def scan(self, data, limit, final):
+        """!
+        @brief Counts the comment bytes before the limit.
+
+        @param data The content carried over and the next piece.
+        @param limit The offset returned by get_limit (the end of the content if final).
+        @param final Whether this is the last piece of the content.
+        @return Returns the offset to go on from with the next piece.
+        """
+        position = self.position
+        while True:
+            if self.inside:
+                end = data.find(b'\n', position)
+                if end == -1:
+                    self.number += len(data) - position
+                    return len(data)
+                self.number += end + 1 - position
+                position = end + 1
+                self.inside = False
+            start = data.find(b'//', position)
+            if start == -1 or start >= limit:
+                return max(position, limit)
+            self.number += 2
+            position = start + 2
+            self.inside = True
+
+
+class BlockCommentCounter(Counter):
+    # /*/ has to be seen whole to tell it from /*
+    margin = 3
+    # */ right before /* keeps it from opening a comment
+    context = 2
+
+    def __init__(self, opener):
+        """!
+        @brief Counts the bytes of the multiline comments.
+        A comment runs from /* to the nearest */ (or to the end of
+        the content), /*/ is a comment of its own and a slash between
+        two stars is a one byte comment.
+
+        @param opener The compiled bytes regex matching where a comment starts (the lone slash or /*).
+        """
+        Counter.__init__(self)
+        self.opener = opener
+        self.inside = False
+
+    def scan(self, data, limit, final):
+        """!
+        @brief Counts the comment bytes before the limit.
+
+        @param data The content carried over and the next piece.
+        @param limit The offset returned by get_limit (the end of the content if final).
+        @param final Whether this is the last piece of the content.
+        @return Returns the offset to go on from with the next piece.
+        """
+        position = self.position
+        while True:
+            if self.inside:
+                end = data.find(b'*/', position)
+                if end == -1:
+                    # a star at the end may be closing the comment
+                    stop = len(data) if final else max(len(data) - 1, position)
+                    self.number += stop - position
+                    return stop
+                self.number += end + 2 - position
+                position = end + 2
+                self.inside = False
+            found = self.opener.search(data, position)
+            if found is None or found.start() >= limit:
+                return max(position, limit)
+            position = found.end()
+            self.number += position - found.start()
+            if position - found.start() == 1:
+                continue
+            if data[position:position + 1] == b'/':
+                self.number += 1
+                position += 1
+            else:
+                self.inside = True
@@ -12,76 +12,409 @@ specified data – keywords, patterns, operators, identifiers
 and so on. More info in the assignment.
 """
 
+import cProfile
+import sqlite3
 import sys
+import os
+from api import iterate_records
+from archive import ArchiveError
 from arguments import Arguments
+from baseline import Baseline
+from client import connect, get_forwarded_args
 from parser import Parser
+from partial import Partial, check_shards
+from server import Server
+from sketch import TopCounter
+from watcher import Watcher
+from writer import get_writer
 
 
-def main():
+def main(cache=None):
     """!
     @brief Puts the bits and pieces together.
     Uses the available classes from the imported modules to carry
     out the functionality specified by the assignment. For more
     information, consult the enclosed documentation.
+
+    @param cache The MemoryCache of the server running the command line (--serve), None outside of it.
     """
     ### INITIATING NEEDED OBJECTS ###
     arguments = Arguments()
     arguments.get_args()
+    ### END INITIATING NEEDED OBJECTS ###
+
+    ### SERVING THE RUNS ###
+    if cache is not None:
+        if arguments.args_dict['serve'] is not None or arguments.args_dict['connect'] is not None or \
+                arguments.args_dict['watch'] is True:
+            sys.stderr.write('--serve, --connect and --watch cannot be sent to a server.\n')
+            sys.exit(1)  # exit code 1 => forbidden combination of arguments
+        # the workers would not see the counts kept in memory
+        arguments.args_dict['jobs'] = 1
+    elif arguments.args_dict['connect'] is not None:
+        socket_path, argv = get_forwarded_args(sys.argv[1:])
+        sys.exit(connect(socket_path, argv))
+    elif arguments.args_dict['serve'] is not None:
+        server = Server(arguments.args_dict['serve'], arguments.args_dict['cache_size'])
+        error = server.serve(main)
+        if error is not None:
+            sys.stderr.write(error + '\n')
+            sys.exit(3)
+        return
+    ### END SERVING THE RUNS ###
+
+    ### INITIATING NEEDED OBJECTS ###
+    profiler = None
+    if arguments.args_dict['profile'] is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
     parser = Parser()
+    # the counts of the identifiers are never cached
+    if cache is not None and arguments.args_dict['top_identifiers'] is None:
+        parser.cache = cache
+    # the clock of the whole run starts here
+    parser.get_stats(arguments.args_dict)
     parser.get_all_filepaths(arguments.args_dict)
     ### END INITIATING NEEDED OBJECTS ###
 
-    ### CLEANING THE OUTPUT FILE ###
-    if arguments.args_dict['output_file'] is not None:
-        try:
-            open(arguments.args_dict['output_file'], 'w').close()
-        except:
-            sys.stderr.write('The output file ' + arguments.args_dict['output_file'] +
-                             ' cannot be opened.')
-            sys.exit(3)
-    ### END CLEANING THE OUTPUT FILE ###
+    ### LOADING THE BASELINE ###
+    baseline = None
+    if arguments.args_dict['since'] is not None:
+        baseline = Baseline(parser.version)
+        error = baseline.load(arguments.args_dict['baseline'], parser.get_record_keys(arguments.args_dict))
+        if error is not None:
+            sys.stderr.write(error + '\n')
+            sys.exit(2)
+        # only the files changed since the commit are counted
+        sources, deleted = parser.get_changed_files(arguments.args_dict)
+    # nothing is counted, the records come from the partial results (--merge)
+    elif arguments.args_dict['merge'] is not None:
+        sources = list()
+    # the files listed (--files-from) or the content piped in (--stdin-source)
+    elif arguments.args_dict['files_from'] is not None or arguments.args_dict['stdin_source'] is not None:
+        sources = parser.files_list
+    else:
+        sources = [arguments.args_dict['input_file']]
+    ### END LOADING THE BASELINE ###
+
+    ### OPENING THE CACHE ###
+    # an unusable cache directory is reported before the output file is emptied
+    try:
+        parser.get_cache(arguments.args_dict)
+    except (OSError, sqlite3.Error):
+        sys.stderr.write('The cache directory ' + arguments.args_dict['cache_dir'] + ' cannot be opened.\n')
+        sys.exit(3)
+    ### END OPENING THE CACHE ###
+
+    ### OPENING THE OUTPUT ###
+    metrics = parser.get_metrics(arguments.args_dict)
+    keys = parser.get_record_keys(arguments.args_dict)
+    # the most frequent identifiers are written along with the numbers
+    columns = keys + ['top_identifiers'] if arguments.args_dict['top_identifiers'] is not None else keys
+    # a shard writes its partial result as it is, whatever the format of the report (--shard)
+    output_format = arguments.args_dict['format'] if arguments.args_dict['shard'] is None else 'text'
+    try:
+        writer = get_writer(output_format, arguments.args_dict['output_file'], columns)
+    except OSError:
+        sys.stderr.write('The output file ' + arguments.args_dict['output_file'] +
+                         ' cannot be opened.')
+        sys.exit(3)
+    ### END OPENING THE OUTPUT ###
 
     ### GETTING THE FINAL NUMBER OF OCCURRENCES ###
-    total_num = 0
-    for file in parser.files_list:
-        num = parser.process_file(file, arguments.args_dict)
-        total_num += num
+    # the files are checked for changes against their state before being counted
+    snapshot = None
+    if arguments.args_dict['watch'] is True:
+        snapshot = parser.get_snapshot(arguments.args_dict)
+    totals = dict([(key, 0) for key in keys])
+    # the machine-readable records are written as soon as each of the files is counted, unless sorted
+    streamed = arguments.args_dict['format'] != 'text' and arguments.args_dict['sort'] is False and \
+        baseline is None and arguments.args_dict['shard'] is None
+    # record of each of the files counted, kept for --since, --watch and --save-baseline
+    kept = (baseline is not None or arguments.args_dict['watch'] is True or
+            arguments.args_dict['save_baseline'] is not None)
+    records = dict()
+    try:
+        for file, record in iterate_records(sources, arguments.args_dict, parser):
+            parser.process_top_identifiers(record, arguments.args_dict)
+            if streamed:
+                writer.write_record('file', parser.get_printed_path(file, arguments.args_dict), record)
+            elif baseline is None:
+                parser.process_file(file, arguments.args_dict, record)
+            if baseline is None:
+                for key in keys:
+                    totals[key] += record[key]
+            if kept:
+                records[file] = record
+    except ArchiveError as error:
+        writer.close()
+        sys.stderr.write(str(error) + '\n')
+        sys.exit(21)  # exit code 21 => non-readable file
+
+    if baseline is not None:
+        # the other files as they were at the commit
+        old_records = parser.get_baseline_records(baseline, arguments.args_dict)
+        for file in deleted:
+            parser.process_delta(file, arguments.args_dict, metrics, old_records.pop(file, None), None)
+        for file in records:
+            parser.process_delta(file, arguments.args_dict, metrics, old_records.get(file), records[file])
+        old_records.update(records)
+        records = old_records
+        for file, record in records.items():
+            parser.process_file(file, arguments.args_dict, record)
+            for key in keys:
+                totals[key] += record[key]
+
+    ### MERGING THE PARTIAL RESULTS ###
+    if arguments.args_dict['merge'] is not None:
+        partials = list()
+        for filepath in arguments.args_dict['merge']:
+            partial = Partial(parser.version, keys)
+            partial.top_number = arguments.args_dict['top_identifiers']
+            error = partial.load(filepath)
+            if error is not None:
+                writer.close()
+                sys.stderr.write(error + '\n')
+                sys.exit(2)
+            partials.append(partial)
+        error = check_shards(partials)
+        if error is not None:
+            writer.close()
+            sys.stderr.write(error + '\n')
+            sys.exit(1)  # exit code 1 => forbidden combination of arguments
+        merge_partials(parser, writer, partials, keys, totals, streamed)
+    ### END MERGING THE PARTIAL RESULTS ###
+
+    if arguments.args_dict['top_identifiers'] is not None:
+        if parser.top_identifiers is None:
+            parser.top_identifiers = TopCounter(arguments.args_dict['top_capacity'])
+        totals['top_identifiers'] = parser.top_identifiers.get_top(arguments.args_dict['top_identifiers'])
+        if not parser.top_identifiers.is_exact():
+            sys.stderr.write('The counts of the top identifiers are estimates, each of them may be lower than '
+                             'the true one by up to ' + str(parser.top_identifiers.error) + '.\n')
     ### END GETTING THE FINAL NUMBER OF OCCURRENCES ##
 
-    ### ALIGNING THE TOTAL NUMBER ###
-    total_text = 'CELKEM: '
-    total_num_padding = ''
-    total_padding = ''.join([' ' for s in range(parser.maxlen - len(total_text))])
-    total_num_padding = ''.join([' ' for s in range(parser.maxlen_num - len(str(total_num)))])
-    ### END ALIGNING THE TOTAL NUMBER ###
+    with parser.measure('report', 0):
+        # the shard only writes what the report is made of (--shard)
+        if arguments.args_dict['shard'] is not None:
+            writer.write(get_partial(parser, arguments.args_dict, keys).dumps())
+        else:
+            print_report(parser, writer, arguments.args_dict, metrics, totals)
+
+    ### SAVING THE BASELINE ###
+    if arguments.args_dict['save_baseline'] is not None:
+        baseline = Baseline(parser.version)
+        directory = arguments.args_dict['input_file']
+        if not os.path.isdir(directory):
+            directory = os.path.dirname(directory) or '.'
+        baseline.records = dict([(os.path.relpath(file, directory).replace(os.sep, '/'), record)
+                                 for file, record in records.items()])
+        try:
+            baseline.save(arguments.args_dict['save_baseline'])
+        except OSError:
+            writer.close()
+            sys.stderr.write('The baseline ' + arguments.args_dict['save_baseline'] + ' cannot be saved.\n')
+            sys.exit(3)
+    ### END SAVING THE BASELINE ###
+
+    ### WATCHING THE FILES ###
+    if arguments.args_dict['watch'] is True:
+        watch(parser, writer, arguments.args_dict, metrics, totals, records, snapshot)
+    ### END WATCHING THE FILES ###
+    writer.close()
+
+    ### REPORTING THE STATS ###
+    if profiler is not None:
+        profiler.disable()
+        try:
+            profiler.dump_stats(arguments.args_dict['profile'])
+        except OSError:
+            sys.stderr.write('The profile ' + arguments.args_dict['profile'] + ' cannot be saved.\n')
+            sys.exit(3)
+    if parser.stats is not None:
+        try:
+            parser.stats.write(arguments.args_dict['stats'])
+        except OSError:
+            sys.stderr.write('The stats ' + arguments.args_dict['stats'] + ' cannot be saved.\n')
+            sys.exit(3)
+    ### END REPORTING THE STATS ###
+
+
+def print_report(parser, writer, args_dict, metrics, totals):
+    """!
+    @brief Prints the results of all the files processed.
+    Prints the line of each of the files, the total and the
+    histograms (if any), or the records of the files not written
+    yet and the totals in a machine-readable format.
+
+    @param parser The Parser holding the results.
+    @param writer The Writer of the output.
+    @param args_dict The dictionary of user-side arguments.
+    @param metrics The list of metric keys, one column each.
+    @param totals The dictionary of record key => total number.
+    """
+    if args_dict['format'] != 'text':
+        print_records(parser, writer, args_dict, totals)
+        return
 
-    ### SORTING THE RESULTS ###
-    results = parser.result_strings
-    results.sort()
-    ### END SORTING THE RESULTS ###
+    ### ALIGNING THE RESULTS ###
+    # the widths are only known once all the files are counted (add_result)
+    total_string = parser.format_total(metrics, totals, args_dict['output_file'])
+    ### END ALIGNING THE RESULTS ###
 
     ### PRINTING THE SEMI-RESULTS ###
-    for item in sorted(results):
-        if arguments.args_dict['output_file'] is not None:
-            with open(arguments.args_dict['output_file'], 'a', encoding='iso-8859-2') as output_file_handle:
-                output_file_handle.write(item)
-        else:
-            sys.stdout.write(item)
+    # the results come out sorted (merged from the runs spilled to disk, if any)
+    for filepath, record in parser.results:
+        writer.write(parser.format_results(filepath, record))
     ### END PRINTING THE SEMI-RESULTS ###
 
     ### PRINTING THE TOTAL NUMBER ###
-    if arguments.args_dict['output_file'] is not None:
-        with open(arguments.args_dict['output_file'], 'a', encoding='iso-8859-2') as output_file_handle:
-            output_file_handle.write(total_text + total_padding + total_num_padding + str(total_num) + '\n')
-    else:
-        if len(str(total_num)) == 2 and parser.maxlen_num != 1:
-            sys.stdout.write(total_text + total_padding + ' ' + total_num_padding + str(total_num) + '\n')
-        else:
-            sys.stdout.write(total_text + total_padding + total_num_padding + str(total_num) + '\n')
+    writer.write(total_string)
     ### END PRINTING THE RESULTS ###
 
-    if arguments.args_dict['output_file'] is not None:
-        output_file_handle.close()
+    ### PRINTING THE HISTOGRAM ###
+    # each of them separated from the previous part by an empty line
+    sections = list()
+    if args_dict['histogram'] is True:
+        sections.append(parser.format_histogram('keyword:', parser.keywords_list))
+    if args_dict['operator_histogram'] is True:
+        sections.append(parser.format_histogram('operator:', parser.operators_list))
+    patterns = args_dict['word_search']
+    if patterns is not None and len(patterns) > 1:
+        sections.append(parser.format_histogram('pattern:', patterns))
+    if args_dict['top_identifiers'] is not None:
+        sections.append(parser.format_top_identifiers(totals['top_identifiers']))
+    if args_dict['since'] is not None:
+        sections.append(parser.format_deltas(metrics))
+    for section in sections:
+        writer.write('\n')
+        for item in section:
+            writer.write(item)
+    ### END PRINTING THE HISTOGRAM ###
+
+
+def get_partial(parser, args_dict, keys):
+    """!
+    @brief Gets the partial result of the files of the shard (--shard).
+
+    @param parser The Parser holding the results.
+    @param args_dict The dictionary of user-side arguments.
+    @param keys The list of record keys.
+    @return Returns the Partial.
+    """
+    partial = Partial(parser.version, keys)
+    partial.shard = args_dict['shard']
+    partial.records = list(parser.results)
+    partial.maxlen = parser.maxlen
+    partial.maxlen_num = parser.maxlen_num
+    if args_dict['top_identifiers'] is not None:
+        partial.top_number = args_dict['top_identifiers']
+        partial.top_identifiers = parser.top_identifiers or TopCounter(args_dict['top_capacity'])
+    return partial
+
+
+def merge_partials(parser, writer, partials, keys, totals, streamed):
+    """!
+    @brief Puts the partial results of the shards together (--merge).
+    The records are taken the way the files counted by a single run
+    are, the widths of the columns are those of the widest shard.
+    The widths only ever grow (add_result), so they do not depend on
+    the order of the shards and their records.
+
+    @param parser The Parser to hold the results.
+    @param writer The Writer of the output.
+    @param partials The list of the loaded Partial objects, one for each of the shards.
+    @param keys The list of record keys.
+    @param totals The dictionary of record key => total number, updated in place.
+    @param streamed Whether the records are written right away instead of being kept for the report.
+    """
+    for partial in partials:
+        parser.maxlen = max(parser.maxlen, partial.maxlen)
+        for metric, width in partial.maxlen_num.items():
+            parser.maxlen_num[metric] = max(parser.maxlen_num.get(metric, 0), width)
+        for filepath, record in partial.records:
+            if streamed:
+                writer.write_record('file', filepath, record)
+            else:
+                parser.add_result(filepath, record)
+            for key in keys:
+                totals[key] += record[key]
+        if partial.top_identifiers is not None:
+            if parser.top_identifiers is None:
+                parser.top_identifiers = TopCounter(partial.top_identifiers.capacity)
+            parser.top_identifiers.merge(partial.top_identifiers)
+
+
+def print_records(parser, writer, args_dict, totals):
+    """!
+    @brief Prints the report in a machine-readable format.
+    Writes the records of the files which were not written while
+    being counted (sorted by the filepath with --sort), the totals
+    and the changes of the files (--since).
+
+    @param parser The Parser holding the results.
+    @param writer The Writer of the output.
+    @param args_dict The dictionary of user-side arguments.
+    @param totals The dictionary of record key => total number.
+    """
+    # the results come out sorted
+    for filepath, record in parser.results:
+        writer.write_record('file', filepath, record)
+    writer.write_record('total', None, totals)
+    for filepath, delta in sorted(parser.deltas, key=lambda result: result[0]):
+        writer.write_record('delta', filepath, delta)
+
+
+def watch(parser, writer, args_dict, metrics, totals, records, snapshot):
+    """!
+    @brief Keeps the report up to date with the files (--watch).
+    Waits for the files to change, counts only the files added or
+    modified, drops the deleted ones and adjusts the totals by the
+    difference, then prints the whole report again. Runs until
+    interrupted.
+
+    @param parser The Parser holding the results.
+    @param writer The Writer of the output.
+    @param args_dict The dictionary of user-side arguments.
+    @param metrics The list of metric keys, one column each.
+    @param totals The dictionary of record key => total number, updated in place.
+    @param records The dictionary of filepath => record of occurrences of the files counted, updated in place.
+    @param snapshot The state of the files when they were counted, as returned by Parser.get_snapshot.
+    """
+    watcher = Watcher(args_dict['watch_interval'])
+    try:
+        while True:
+            snapshot, changed, deleted = watcher.wait_for_changes(lambda: parser.get_snapshot(args_dict), snapshot)
+
+            ### ADJUSTING THE TOTALS ###
+            for file in deleted:
+                if file in records:
+                    old_record = records.pop(file)
+                    for key in totals:
+                        totals[key] -= old_record[key]
+            for file in changed:
+                try:
+                    record = parser.count_file(file, args_dict)
+                # gone again before it could be read, it is deleted by the next check
+                except OSError:
+                    continue
+                old_record = records.get(file)
+                records[file] = record
+                for key in totals:
+                    totals[key] += record[key] - (old_record[key] if old_record is not None else 0)
+            parser.close_cache(args_dict)
+            ### END ADJUSTING THE TOTALS ###
+
+            ### PRINTING THE UPDATED REPORT ###
+            parser.clear_results()
+            for file, record in records.items():
+                parser.process_file(file, args_dict, record)
+            writer.restart()
+            print_report(parser, writer, args_dict, metrics, totals)
+            writer.flush()
+            ### END PRINTING THE UPDATED REPORT ###
+    except KeyboardInterrupt:
+        parser.close_cache(args_dict)
 
 ##########################
 if __name__ == '__main__':
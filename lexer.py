@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+#CST:xvitas02
+
+"""!
+@package lexer.py
+Splitting C files into tokens.
+
+This module scans the content of a file exactly once and
+splits it into macros, comments, strings, char literals and
+the remaining code, so that the parser does not have to strip
+each of them in a separate pass over the file. It works on the
+raw ISO-8859-2 bytes (a memory-mapped file included), tokens
+only refer to the content by offsets. The content can also be
+scanned chunk by chunk, the state is carried over in between.
+"""
+
+import array
+import re
+
+
+class Lexer:
+    # token kinds
+    MACRO = 'macro'
+    LINE_COMMENT = 'line_comment'
+    BLOCK_COMMENT = 'block_comment'
+    STRING = 'string'
+    QUOTE = 'quote'
+    CHAR = 'char'
+    CODE = 'code'
+
+    # scanner states
+    STATE_CODE = 0
+    STATE_BLOCK = 1
+    STATE_STRING = 2
+    STATE_CHAR = 3
+    # a macro or an inline comment continued from the previous chunk
+    STATE_MACRO = 4
+    STATE_LINE = 5
+
+    # number of bytes a token needs to be seen after its start to be recognised
+    margin = 4
+    # number of bytes before the start of a scan seen by the lookbehinds
+    context = 1
+
+    # macros and inline comments take precedence over everything else,
+    # a macro runs until a newline not preceded by a backslash
+    _macro = r'(?P<macro>#[^\n\\]*(?:\\\n?[^\n\\]*){0,1024})'
+    _line = r'(?P<line>//[^\n#]*)'
+    # a slash right after a star only hides itself, otherwise /* opens
+    # a comment which is closed straight away by a following lone slash
+    _stray = r'(?P<stray>(?<=\*)/(?=\*))'
+    _block = r'(?P<block>/\*(?:/(?!/))?)'
+
+    # plain text is written unrolled – a run of ordinary bytes, then lone
+    # special bytes each followed by such a run – as every repeat of a group
+    # costs the regex engine a backtrack frame (some 300 bytes); the special
+    # bytes are repeated only so many times, longer text takes more tokens
+    # (a macro with more backslashes is carried on like one cut by a chunk)
+    _code = r'(?P<body>(?:[^#/"\']|/(?![/*]))[^#/"\']*(?:/(?![/*])[^#/"\']*){0,1024})'
+    _comment = r'(?P<body>(?:[^#/*]|\*(?!/(?!/))|/(?!/))[^#/*]*(?:(?:\*+(?!/(?!/))|/(?!/))[^#/*]*){0,1024})'
+    _string = r'(?P<body>(?:[^#/"]|/(?![/*]))[^#/"]*(?:/(?![/*])[^#/"]*){0,1024})'
+
+    # one compiled alternation per scanner state
+    state_regexes = {
+        STATE_CODE: re.compile('|'.join([_macro, _line, _stray, _block, r'(?P<dquote>")', r"(?P<squote>')",
+                                         _code]).encode()),
+        STATE_BLOCK: re.compile('|'.join([_macro, _line, r'(?P<end>\*/(?!/))', _comment]).encode()),
+        STATE_STRING: re.compile('|'.join([_macro, _line, _stray, _block, r'(?P<dquote>")', _string]).encode()),
+        STATE_CHAR: re.compile('|'.join([_macro, _line, _stray, _block, r'(?P<dquote>")', r"(?P<squote>')",
+                                         _code]).encode()),
+        STATE_MACRO: re.compile(r'(?P<macro>[^\n\\]*(?:\\\n?[^\n\\]*){0,1024})'.encode()),
+        STATE_LINE: re.compile(r'(?P<line>[^\n#]*)'.encode()),
+    }
+
+    # bound match methods to save attribute lookups in the scanning loop
+    state_matchers = dict([(state, regex.match) for state, regex in state_regexes.items()])
+
+    # kind of the plain text found in each of the states
+    body_kinds = {
+        STATE_CODE: CODE,
+        STATE_BLOCK: BLOCK_COMMENT,
+        STATE_STRING: STRING,
+        STATE_CHAR: CHAR,
+    }
+
+    def tokenize(self, data, scan=None, final=True):
+        """!
+        @brief Splits C file content into tokens.
+        Scans the content once, keeping a small stack of the states
+        it is nested in (a comment inside a string inside a char
+        literal and so on). The precedence mirrors the order the file
+        used to be stripped in – macros, inline comments, multiline
+        comments, strings and finally char literals – so the counts
+        stay the same.
+
+        Unless the content is final, the scan stops where the bytes
+        still to come could change the tokens. A macro, an inline
+        comment or plain text running on is split there and carried
+        on in the next chunk.
+
+        @param data The bytes of the file passed (bytes, mmap or any other buffer).
+        @param scan The ScanState to start from and to update, None to scan the content whole.
+        @param final Whether the content ends with data or more of it is to come.
+        @return Yields (kind, start, end) tuples covering the content scanned.
+        """
+        if scan is None:
+            scan = ScanState()
+        stack = scan.stack
+        state = stack[-1]
+        match = self.state_matchers[state]
+        position = scan.position
+        limit = len(data) if final else len(data) - self.margin
+        while position < limit:
+            found = match(data, position)
+            group = found.lastgroup
+            end = found.end()
+            ### PLAIN TEXT ###
+            if group == 'body':
+                if end > limit:
+                    end = limit
+                yield self.body_kinds[state], position, end
+                position = end
+                continue
+            ### PRECEDING STAGES ###
+            if group == 'macro' or group == 'line':
+                if end > limit:
+                    # running on into the next chunk, a backslash is kept together with its newline
+                    end = limit
+                    if group == 'macro' and data[end - 1:end + 1] == b'\\\n':
+                        end += 1
+                    if state != self.STATE_MACRO and state != self.STATE_LINE:
+                        stack.append(self.STATE_MACRO if group == 'macro' else self.STATE_LINE)
+                elif data[end:end + 1] == b'\\':
+                    # too many backslashes for one match, the macro goes on
+                    if state != self.STATE_MACRO:
+                        stack.append(self.STATE_MACRO)
+                elif state == self.STATE_MACRO or state == self.STATE_LINE:
+                    stack.pop()
+                if end > position:
+                    yield self.MACRO if group == 'macro' else self.LINE_COMMENT, position, end
+            ### MULTILINE COMMENTS ###
+            elif group == 'stray':
+                yield self.BLOCK_COMMENT, position, end
+            elif group == 'block':
+                yield self.BLOCK_COMMENT, position, end
+                # /*/ is already a complete comment
+                if end - position == 2:
+                    stack.append(self.STATE_BLOCK)
+            elif group == 'end':
+                yield self.BLOCK_COMMENT, position, end
+                stack.pop()
+            ### STRINGS ###
+            elif group == 'dquote':
+                yield self.STRING, position, end
+                if state == self.STATE_STRING:
+                    stack.pop()
+                else:
+                    stack.append(self.STATE_STRING)
+            ### CHAR LITERALS ###
+            elif group == 'squote':
+                yield self.QUOTE, position, end
+                if state == self.STATE_CHAR:
+                    stack.pop()
+                else:
+                    stack.append(self.STATE_CHAR)
+            position = end
+            state = stack[-1]
+            match = self.state_matchers[state]
+        scan.position = position
+
+    def get_spans(self, tokens, views, length=None):
+        """!
+        @brief Collects the parts of the content each view consists of.
+        A view is the content with only some kinds of tokens left in
+        it (e.g. the code without comments and strings). Neighbouring
+        tokens of a view are merged into a single span, so there are
+        only as many spans as there are gaps in the view.
+
+        @param tokens The tokens yielded by tokenize.
+        @param views The list of views, each of them a tuple of the token kinds to keep.
+        @param length The length of the content, the offsets of a content under 4 GiB take half the memory.
+        @return Returns the list of spans for each view, flat arrays of start and end offsets.
+        """
+        typecode = 'I' if length is not None and length < 1 << 32 and array.array('I').itemsize == 4 else 'Q'
+        spans = [array.array(typecode) for view in views]
+        for kind, start, end in tokens:
+            for view, view_spans in zip(views, spans):
+                if kind not in view:
+                    continue
+                # merging with the previous span
+                if view_spans and view_spans[-1] == start:
+                    view_spans[-1] = end
+                else:
+                    view_spans.append(start)
+                    view_spans.append(end)
+        return spans
+
+    def join_spans(self, data, spans):
+        """!
+        @brief Joins the parts of the content a view consists of.
+        Removing the other kinds glues the neighbouring tokens
+        together, just like stripping the file content did. The
+        content is only copied if there is anything to remove.
+
+        @param data The bytes the spans were found in.
+        @param spans The flat array of start and end offsets returned by get_spans.
+        @return Returns the bytes-like content of the view.
+        """
+        if len(spans) == 2 and spans[0] == 0 and spans[1] == len(data):
+            return data
+        if len(spans) == 0:
+            return b''
+        joined = bytearray()
+        view = memoryview(data)
+        for index in range(0, len(spans), 2):
+            joined += view[spans[index]:spans[index + 1]]
+        view.release()
+        return joined
+
+
+class ScanState:
+    """!
+    @brief Where the scan of a chunked content stopped.
+    """
+
+    def __init__(self):
+        """!
+        @brief Starts at the beginning of the content, in the code.
+        """
+        # the states the scan is nested in
+        self.stack = [Lexer.STATE_CODE]
+        # the offset to carry on from
+        self.position = 0
+
+
+def get_byte_class(pattern):
+    """!
+    @brief Turns a str regex class into a bytes one.
+    Matching bytes, \\w or \\s only know ASCII, unlike when matching
+    the decoded content. The class returned lists all the bytes
+    whose ISO-8859-2 character matches the pattern passed.
+
+    @param pattern The str regex matching a single character (e.g. r'\\w').
+    @return Returns the bytes regex class.
+    """
+    regex = re.compile(pattern)
+    members = [re.escape(bytes([byte])) for byte in range(256) if regex.match(bytes([byte]).decode('iso-8859-2'))]
+    return b'[' + b''.join(members) + b']'
@@ -11,25 +11,120 @@ in this project – it parses the assigned values from
 the content of a file and returns the number of matches.
 """
 
+import collections
+import concurrent.futures
+import contextlib
+import fnmatch
+import itertools
 import os
 import re
-import itertools
+import mmap
+import multiprocessing
 import sys
+import time
+from archive import ArchiveError, archive_errors, iterate_members
+from baseline import get_git_changes
+from cache import Cache, get_content_digest, get_file_digest
+from counters import (RegexCounter, WordCounter, TokenCounter, PatternCounter, DeclaratorFilter,
+                      InlineCommentCounter, BlockCommentCounter)
+from lexer import Lexer, ScanState, get_byte_class
+from partial import get_shard
+from sketch import TopCounter
+from sorter import Sorter
+from stats import Stats
 
 
 class Parser:
-    # list to contain all the usable files to iterate over
-    files_list = list()
-    result_strings = list()
-    # maximum length of a filepath/filename to be able to align the output
-    maxlen = 0
-    maxlen_num = 0
+    # version of the counting rules, bump it whenever a change alters the counts
+    version = '2'
+
+    # limits of a batch of files sent to a worker process at once
+    batch_files = 64
+    batch_bytes = 1 << 20
+
+    # single scan splitting the file content into tokens
+    lexer = Lexer()
+    # token kinds left in the content each of the metrics looks at
+    code_view = (Lexer.CODE,)
+    keyword_view = (Lexer.CODE, Lexer.QUOTE, Lexer.CHAR)
+    comment_view = (Lexer.LINE_COMMENT, Lexer.BLOCK_COMMENT, Lexer.STRING, Lexer.QUOTE, Lexer.CHAR, Lexer.CODE)
+    # where multiline comments start when matched character by character (/*/ and a lone slash included)
+    comment_opener_regex = re.compile(rb'/(?:(?<=\*/)(?=\*)|(?<!\*//)\*)')
+
+    # keys of all the metrics in the order of their output columns
+    metrics_list = ['all_keywords', 'simp_ops', 'identifiers', 'word_search', 'comments']
+    # view of the content each metric is counted in (None for the content itself)
+    metric_views = {'all_keywords': keyword_view, 'simp_ops': code_view, 'identifiers': code_view,
+                    'word_search': None, 'comments': comment_view}
 
     # list of C keywords
     keywords_list = ['_Bool', '_Complex', '_Imaginary', 'auto', 'break', 'case', 'char', 'const', 'continue',
                      'default', 'do', 'double', 'else', 'enum', 'extern', 'float', 'for', 'goto', 'if', 'inline',
                      'int', 'long', 'register', 'return', 'short', 'signed', 'sizeof', 'static', 'struct', 'switch',
                      'typedef', 'union', 'unsigned', 'void', 'volatile', 'while']
+    keywords_set = frozenset([keyword.encode() for keyword in keywords_list])
+
+    # the files are matched as bytes, these stand for \w and \s of the decoded ISO-8859-2 content
+    word_class = get_byte_class(r'\w')
+    space_class = get_byte_class(r'\s')
+    # matching based on standard C naming conventions, the keywords are told apart by a lookup
+    identifier_regex = re.compile(b'(?<!' + word_class + b')[_a-zA-Z][_a-zA-Z0-9]*(?!' + word_class + b')')
+    # bytes of a file list (--files-from) read at most at once
+    list_chunk = 1 << 16
+    # bytes of a file hashed at once (--dedup)
+    hash_chunk = 1 << 20
+    # the bytes an identifier can go on with in the next chunk
+    identifier_run = b'_abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+    # list of the operators, the equal sign prefix operators, double char operators and single char operators
+    operators_list = ['+=', '-=', '*=', '/=', '%=', '<<=', '>>=', '<=', '>=', '!=', '&=', '|=', '^=',
+                      '++', '--', '||', '&&', '<<', '>>', '->', '==',
+                      '+', '-', '*', '/', '%', '&', '=', '|', '.', '>', '<', '!', '~', '^']
+    # regexing for the operators, the longest first (a dot only before a name or a space),
+    # the lookahead lets the regex skip the bytes no operator starts with at once
+    operator_regex = re.compile(rb'(?=[-+*/%<>!&|^=.~])((?:\+|-|\*|\/|%|<<|>>|<|>|!|&|\||\^)=|\+\+|--|\|\||&&|<<|>>|->|==|'
+                                rb'(?:\+|-|\*|\/|%|&|=|\||\.(?=[_a-zA-Z]|' + space_class + rb')|>|<|!|~|\^))')
+    # a single pointer declarator after a type name (e.g. ' *', ', **p', '(*f)'), matched one after another
+    declarator_regex = re.compile(space_class + rb'*(?:,' + space_class + rb'*)?(?:\(' + space_class + rb'*)?\*+' +
+                                  space_class + rb'*\(?' + word_class + rb'*\)?')
+    # what a declarator takes before its first star, no other declarator follows once this stops before the end
+    declarator_gap_regex = re.compile(space_class + rb'*(?:,' + space_class + rb'*)?(?:\(' + space_class + rb'*)?')
+    # where a pointer declaration starts (the type name)
+    pointer_start_regex = re.compile(b'(?<!' + word_class + b')(?:_Bool|_Complex|char|const|double|float|int|long|'
+                                     b'short|void)')
+    pointer_margin = len(b'_Complex') + 1
+    # the longest operator
+    operator_margin = 3
+    # any whole word, for looking up the searched words (-w)
+    word_regex = re.compile(b'(?<!' + word_class + b')' + word_class + b'+')
+    # regex matching nothing, for a searched string which cannot occur in an ISO-8859-2 file
+    nothing_regex = re.compile(b'(?!)')
+    # up to this many searched patterns are matched by a regex each, more of them all at once
+    search_regexes = 4
+    # number of results kept in memory, more of them are sorted on disk
+    sort_buffer = 1 << 17
+
+    def __init__(self):
+        """!
+        @brief Starts with no files and no results.
+        All the state lives in the instance, so any number of parsers
+        can be used side by side (in threads too).
+        """
+        # all the usable files to iterate over (a generator while a directory is being walked)
+        self.files_list = list()
+        # (filepath to print, record of occurrences) tuples, iterated over in the order of the output
+        self.results = Sorter(self.get_result_key, self.sort_buffer)
+        # list of (filepath to print, change of the record) tuples of the files changed since a commit (--since)
+        self.deltas = list()
+        # maximum length of a filepath/filename to be able to align the output
+        self.maxlen = 0
+        # maximum length of the number in each metric column
+        self.maxlen_num = dict()
+        # persistent cache of the counts (--cache), opened on demand
+        self.cache = None
+        # time spent in each of the stages (--stats), started on demand
+        self.stats = None
+        # the most frequent identifiers of all the files (--top-identifiers), started on demand
+        self.top_identifiers = None
 
     def get_all_filepaths(self, args_dict):
         """!
@@ -42,6 +137,15 @@ class Parser:
         if args_dict['input_file'] is None:
             args_dict['input_file'] = '.'  # current directory
 
+        # the files listed by the caller, nothing is walked
+        if args_dict['files_from'] is not None:
+            self.files_list = self.get_listed_files(args_dict)
+            return
+        # a single file content piped in
+        if args_dict['stdin_source'] is not None:
+            self.files_list = [(args_dict['stdin_source'], sys.stdin.buffer.read())]
+            return
+
         # file or non-existent dir
         if not os.path.isdir(args_dict['input_file']):
             # either the path exists
@@ -58,462 +162,1244 @@ class Parser:
             else:
                 sys.stderr.write('The filepath you passed does not exist.\n')
                 sys.exit(2)  # exit code 2 => non-existent filepath
-        # directory
+        # directory, walked lazily while the files are being counted
         else:
-            # go into subdirectories
-            if args_dict['subdirs'] is None:
-                for path, subdirs, files in os.walk(args_dict['input_file']):
-                    for filename in files:
-                        filepath = os.path.join(path, filename)
-                        self.get_usable_files(str(filepath))
-            # do not go into subdirectories
-            else:
-                files = [f for f in os.listdir(args_dict['input_file']) if os.path.isfile(args_dict['input_file'] + '/' + f)]
-                for f in files:
-                    self.get_usable_files(args_dict['input_file'] + '/' + str(f))
+            self.files_list = self.walk_directory(args_dict['input_file'], args_dict)
+
+    def get_listed_files(self, args_dict):
+        """!
+        @brief Opens the list of the files to count (--files-from).
+
+        @param args_dict The dictionary of user-side arguments.
+        @return Returns the iterator of the paths listed, read lazily.
+        """
+        if args_dict['files_from'] == '-':
+            return self.read_file_list(sys.stdin.buffer)
+        try:
+            list_handle = open(args_dict['files_from'], 'rb')
+        except OSError:
+            sys.stderr.write('The file list ' + args_dict['files_from'] + ' cannot be read.\n')
+            sys.exit(2)  # exit code 2 => non-existent filepath
+        return self.read_file_list(list_handle)
+
+    def read_file_list(self, list_handle):
+        """!
+        @brief Reads the paths of a file list as they come.
+        The paths are separated either by newlines or by NUL bytes
+        (find -print0, git ls-files -z), whichever comes first. Each
+        path is yielded as soon as it is read, so the counting starts
+        before the whole list is written. The paths which do not
+        exist or cannot be read are skipped with a warning.
+
+        @param list_handle The list opened in binary mode (the file or stdin).
+        @return Yields the paths (a directory is walked, an archive read, any other file counted).
+        """
+        separator = None
+        rest = b''
+        with list_handle:
+            while True:
+                # read1 returns whatever is available, so a pipe is not waited for to fill the chunk
+                chunk = list_handle.read1(self.list_chunk)
+                rest += chunk
+                if separator is None:
+                    match = re.search(b'[\n\0]', rest)
+                    if match is not None:
+                        separator = match.group()
+                # the last path does not have to be followed by a separator
+                if not chunk:
+                    entries = [rest]
+                elif separator is None:
+                    continue
+                else:
+                    entries = rest.split(separator)
+                    rest = entries.pop()
+                for entry in entries:
+                    if separator != b'\0':
+                        entry = entry.rstrip(b'\r')
+                    if not entry:
+                        continue
+                    filepath = os.fsdecode(entry)
+                    if not os.access(filepath, os.R_OK):
+                        sys.stderr.write('The listed file ' + filepath + ' does not exist or is not readable.\n')
+                        continue
+                    yield filepath
+                if not chunk:
+                    return
+
+    def walk_directory(self, directory, args_dict):
+        """!
+        @brief Walks a directory for the usable files.
+        Uses the file types os.scandir reads along with the names, so
+        no file has to be stat-ed. Directories matching an exclude glob
+        are not entered at all. Symbolic links to directories are only
+        followed with --follow-symlinks, a directory reached for the
+        second time (a link loop) is skipped.
+
+        @param directory The directory to walk.
+        @param args_dict The dictionary of user-side arguments.
+        @return Yields the filepaths of the usable files.
+        """
+        exclude = self.get_glob_regex(args_dict['exclude'])
+        include = self.get_glob_regex(args_dict['include'])
+        follow_symlinks = args_dict['follow_symlinks']
+        visited = set()
+        if follow_symlinks:
+            stat = os.stat(directory)
+            visited.add((stat.st_dev, stat.st_ino))
+
+        # directories still to walk along with their paths relative to the one passed
+        stack = [(directory, '')]
+        while stack:
+            path, relpath = stack.pop()
+            subdirs = list()
+            try:
+                with os.scandir(path) as entries:
+                    for entry in entries:
+                        entry_relpath = relpath + entry.name
+                        try:
+                            ### DIRECTORIES ###
+                            if entry.is_dir(follow_symlinks=follow_symlinks):
+                                if args_dict['subdirs'] is not None:
+                                    continue
+                                if exclude is not None and self.is_glob_matching(exclude, entry.name, entry_relpath):
+                                    continue
+                                if follow_symlinks:
+                                    stat = entry.stat()
+                                    if (stat.st_dev, stat.st_ino) in visited:
+                                        continue
+                                    visited.add((stat.st_dev, stat.st_ino))
+                                subdirs.append((entry.path, entry_relpath + '/'))
+                            ### END DIRECTORIES ###
+
+                            ### FILES ###
+                            elif entry.is_file():
+                                if os.path.splitext(entry.name)[1] not in args_dict['extensions']:
+                                    continue
+                                if exclude is not None and self.is_glob_matching(exclude, entry.name, entry_relpath):
+                                    continue
+                                if include is not None and not self.is_glob_matching(include, entry.name,
+                                                                                     entry_relpath):
+                                    continue
+                                yield entry.path
+                            ### END FILES ###
+                        except OSError:
+                            continue
+            # unreadable directories are skipped, just like os.walk does
+            except OSError:
+                continue
+            # keeping the order the subdirectories were listed in
+            stack.extend(reversed(subdirs))
+
+    def get_glob_regex(self, globs):
+        """!
+        @brief Compiles a list of globs into a single regex.
+
+        @param globs The list of shell-style globs (--exclude, --include).
+        @return Returns the compiled regex, None if the list is empty.
+        """
+        if not globs:
+            return None
+        return re.compile('|'.join([fnmatch.translate(glob) for glob in globs]))
+
+    def is_glob_matching(self, regex, name, relpath):
+        """!
+        @brief Matches a file or directory against globs.
+        A glob may either match the name or the path relative to the
+        directory walked (e.g. build, *.gen.c or vendor/*/tests).
+
+        @param regex The regex returned by get_glob_regex.
+        @param name The name of the file or directory.
+        @param relpath The path relative to the directory walked, separated by slashes.
+        @return Returns True if any of the globs matches.
+        """
+        return regex.match(name) is not None or regex.match(relpath) is not None
+
+    def is_path_walked(self, relpath, args_dict, exclude, include):
+        """!
+        @brief Tells whether walking the directory would yield a file.
+        Applies the same rules as walk_directory to a path found some
+        other way, a directory on the path may be excluded too.
+
+        @param relpath The path relative to the directory walked, separated by slashes.
+        @param args_dict The dictionary of user-side arguments.
+        @param exclude The regex of the exclude globs returned by get_glob_regex.
+        @param include The regex of the include globs returned by get_glob_regex.
+        @return Returns True if the file would be yielded.
+        """
+        parts = relpath.split('/')
+        if args_dict['subdirs'] is not None and len(parts) > 1:
+            return False
+        if os.path.splitext(parts[-1])[1] not in args_dict['extensions']:
+            return False
+        if exclude is not None:
+            for index in range(len(parts)):
+                if self.is_glob_matching(exclude, parts[index], '/'.join(parts[:index + 1])):
+                    return False
+        if include is not None and not self.is_glob_matching(include, parts[-1], relpath):
+            return False
+        return True
+
+    def get_changed_files(self, args_dict):
+        """!
+        @brief Gets the usable files changed since a commit (--since).
+        Asks git for the files changed and keeps those walking the
+        directory would yield.
+
+        @param args_dict The dictionary of user-side arguments.
+        @return Returns the tuple of the list of the filepaths added or modified and the list
+        of the filepaths deleted.
+        """
+        directory = args_dict['input_file']
+        if not os.path.isdir(directory):
+            sys.stderr.write('--since needs a directory inside a git working tree.\n')
+            sys.exit(1)  # exit code 1 => forbidden combination of arguments
+        changes = get_git_changes(directory, args_dict['since'])
+        if isinstance(changes, str):
+            sys.stderr.write(changes + '\n')
+            sys.exit(1)  # exit code 1 => invalid argument value
+        exclude = self.get_glob_regex(args_dict['exclude'])
+        include = self.get_glob_regex(args_dict['include'])
+        changed, deleted = [[os.path.join(directory, relpath) for relpath in paths
+                             if self.is_path_walked(relpath, args_dict, exclude, include)] for paths in changes]
+        # a file removed from the index only is listed as both deleted and untracked
+        changed = list(dict.fromkeys([filepath for filepath in changed if os.path.isfile(filepath)]))
+        return changed, [filepath for filepath in deleted if filepath not in changed]
+
+    def get_baseline_records(self, baseline, args_dict):
+        """!
+        @brief Gets the records of the usable files from a baseline (--since).
+
+        @param baseline The Baseline loaded.
+        @param args_dict The dictionary of user-side arguments.
+        @return Returns the dictionary of filepath => record of occurrences.
+        """
+        exclude = self.get_glob_regex(args_dict['exclude'])
+        include = self.get_glob_regex(args_dict['include'])
+        return dict([(os.path.join(args_dict['input_file'], relpath), record)
+                     for relpath, record in baseline.records.items()
+                     if self.is_path_walked(relpath, args_dict, exclude, include)])
+
+    def get_snapshot(self, args_dict):
+        """!
+        @brief Gets the current state of the usable files (--watch).
+        Walks the directory again (or takes the file passed), so the
+        files added and deleted since the last snapshot are seen too.
+
+        @param args_dict The dictionary of user-side arguments.
+        @return Returns the dictionary of filepath => (size, modification time, inode).
+        """
+        if os.path.isdir(args_dict['input_file']):
+            files = self.walk_directory(args_dict['input_file'], args_dict)
+        else:
+            files = [args_dict['input_file']]
+        snapshot = dict()
+        for filepath in files:
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                continue
+            snapshot[filepath] = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+        return snapshot
+
+    def get_metrics(self, args_dict):
+        """!
+        @brief Gets the metrics requested.
+        Gets the keys of all the metrics the user asked for, in the
+        order their columns are printed in.
+
+        @param args_dict The dictionary of user-side arguments.
+        @return Returns the list of metric keys.
+        """
+        return [metric for metric in self.metrics_list if args_dict[metric] not in (None, False)]
+
+    def get_record_keys(self, args_dict):
+        """!
+        @brief Gets the keys a record of occurrences holds.
 
-    def get_usable_files(self, filepath):
+        @param args_dict The dictionary of user-side arguments.
+        @return Returns the list of record keys.
+        """
+        keys = self.get_metrics(args_dict)
+        if args_dict['histogram'] is True:
+            keys += ['keyword:' + keyword for keyword in self.keywords_list]
+        if args_dict['operator_histogram'] is True:
+            keys += ['operator:' + operator for operator in self.operators_list]
+        if args_dict['word_search'] is not None and len(args_dict['word_search']) > 1:
+            keys += ['pattern:' + pattern for pattern in args_dict['word_search']]
+        return keys
+
+    def count_files(self, files, args_dict):
         """!
-        @brief Gets .c or .h filepaths.
-        Gets all the usable files to get stats from.
+        @brief Counts the occurrences in the files passed.
+        Runs count_file over the files, either one file after
+        another or spread over a pool of processes (--jobs). Small
+        files are sent to the workers in batches to keep the number
+        of round trips down. The files are yielded in the order
+        passed either way, with --dedup the copies of a file right
+        after it. With --prefetch the files are read ahead while
+        the previous ones are being counted. With --shard only the
+        files of the shard are counted.
+
+        @param files The iterable of filepaths (e.g. the files list).
+        @param args_dict The dictionary of user-side arguments.
+        @return Yields tuples of the filepath and its record of occurrences.
+        """
+        if self.get_stats(args_dict) is not None:
+            files = self.measure_walk(files)
+        if args_dict['shard'] is not None:
+            files = (filepath for filepath in files if self.is_in_shard(filepath, args_dict))
+        # filepath => list of the filepaths of its copies, which are not counted again
+        copies = dict()
+        if args_dict['dedup'] is True:
+            files, copies = self.find_duplicates(files, args_dict)
+        # a single file is not worth starting any processes either (only peeked at for a pool,
+        # so a serial run starts on the first file of a list still being written)
+        files = iter(files)
+        head = list(itertools.islice(files, 2)) if args_dict['jobs'] != 1 else list()
+        files = itertools.chain(head, files)
+        # serial run, no need to start any processes
+        if args_dict['jobs'] == 1 or len(head) < 2:
+            for filepath, data in self.get_contents(files, args_dict):
+                record = self.count_file(filepath, args_dict, data)
+                # taken before the caller can change the record
+                copied = [(copy, dict(record)) for copy in copies.get(filepath, ())]
+                yield filepath, record
+                for copy, copy_record in copied:
+                    yield copy, copy_record
+            return
+
+        # the batches are handed out while the directory is still being walked
+        tasks = ((batch, args_dict) for batch in self.get_batches(files))
+        with multiprocessing.Pool(args_dict['jobs']) as pool:
+            # imap keeps the order of the batches
+            for results, stats in pool.imap(count_batch, tasks):
+                if stats is not None:
+                    self.stats.merge(stats)
+                for filepath, record in results:
+                    copied = [(copy, dict(record)) for copy in copies.get(filepath, ())]
+                    yield filepath, record
+                    for copy, copy_record in copied:
+                        yield copy, copy_record
+
+    def find_duplicates(self, files, args_dict):
+        """!
+        @brief Finds the files with the same content (--dedup).
+        Gets all the files first, only those of the same size as
+        another one are hashed, the rest cannot have a copy. Each of
+        the contents is then counted only once.
+
+        @param files The iterable of filepaths.
+        @param args_dict The dictionary of user-side arguments.
+        @return Returns the tuple of the list of the filepaths with a content of their own (the first file
+        of each of the contents) and the dictionary of such a filepath => list of the filepaths of its copies.
+        """
+        files = list(files)
+        sizes = dict()
+        for filepath in files:
+            try:
+                sizes.setdefault(os.path.getsize(filepath), list()).append(filepath)
+            except OSError:
+                continue
+
+        ### HASHING THE CANDIDATES ###
+        copies = dict()
+        saved = 0
+        for size, filepaths in sizes.items():
+            if len(filepaths) < 2:
+                continue
+            # content digest => the first file with the content
+            firsts = dict()
+            for filepath in filepaths:
+                try:
+                    with self.measure('dedup', size):
+                        with open(filepath, 'rb') as filehandle:
+                            digest = get_file_digest(filehandle, self.hash_chunk)
+                except OSError:
+                    continue
+                if digest in firsts:
+                    copies.setdefault(firsts[digest], list()).append(filepath)
+                    saved += size
+                else:
+                    firsts[digest] = filepath
+        ### END HASHING THE CANDIDATES ###
+
+        copied = set([copy for filepaths in copies.values() for copy in filepaths])
+        if self.get_stats(args_dict) is not None:
+            self.stats.add_duplicates(len(copied), saved)
+        return [filepath for filepath in files if filepath not in copied], copies
+
+    def is_in_shard(self, filepath, args_dict):
+        """!
+        @brief Tells whether a file is counted by the shard (--shard).
+
+        @param filepath The path to the file, as walked or listed.
+        @param args_dict The dictionary of user-side arguments.
+        @return Returns True if the file belongs to the shard or no shard was passed.
+        """
+        if args_dict['shard'] is None:
+            return True
+        number, count = args_dict['shard']
+        return get_shard(filepath, count) == number
+
+    def get_contents(self, files, args_dict):
+        """!
+        @brief Pairs the files with their contents read ahead (--prefetch).
+        The contents are not read ahead with a cache, whose hits do
+        not have to be read at all.
+
+        @param files The iterable of filepaths.
+        @param args_dict The dictionary of user-side arguments.
+        @return Yields tuples of the filepath and its content (None if it is left to count_file to read).
+        """
+        if args_dict['prefetch'] == 0 or self.get_cache(args_dict) is not None:
+            for filepath in files:
+                yield filepath, None
+            return
+
+        files = iter(files)
+        # (filepath, future of its content) of the files being read, in the order of the files
+        pending = collections.deque()
+        with concurrent.futures.ThreadPoolExecutor(args_dict['prefetch']) as executor:
+            while True:
+                # the depth of files is being read while the one taken is counted, no more however slow it is
+                while len(pending) <= args_dict['prefetch']:
+                    filepath = next(files, None)
+                    if filepath is None:
+                        break
+                    pending.append((filepath, executor.submit(self.prefetch_file, filepath, args_dict['chunk_size'])))
+                if not pending:
+                    return
+                filepath, future = pending.popleft()
+                # the time the counting waits for the reading
+                with self.measure('prefetch', 0):
+                    data = future.result()
+                yield filepath, data
+
+    def prefetch_file(self, filepath, chunk_size):
+        """!
+        @brief Reads a file ahead of its counting, in a thread of get_contents.
+
+        @param filepath The path to the file.
+        @param chunk_size The size of the files read in chunks, which are left to count_file.
+        @return Returns the bytes of the file, None if it is left to count_file (big or not readable).
+        """
+        try:
+            with open(filepath, 'rb') as filehandle:
+                if chunk_size and os.fstat(filehandle.fileno()).st_size > chunk_size:
+                    return None
+                return filehandle.read()
+        # count_file fails the same way it would without --prefetch
+        except OSError:
+            return None
+
+    def measure_walk(self, files):
+        """!
+        @brief Measures the time spent getting the files (walking the directories).
+
+        @param files The iterable of filepaths.
+        @return Yields the filepaths.
+        """
+        files = iter(files)
+        while True:
+            with self.stats.measure('walk', 0):
+                filepath = next(files, None)
+            if filepath is None:
+                return
+            yield filepath
+
+    def get_batches(self, files):
+        """!
+        @brief Groups the files into batches for the workers.
+        Files are added to a batch until it holds batch_files files
+        or batch_bytes bytes, so a big file usually makes a batch
+        of its own.
+
+        @param files The iterable of filepaths.
+        @return Yields the batches (lists of filepaths).
+        """
+        batch = list()
+        batch_size = 0
+        for filepath in files:
+            try:
+                size = os.path.getsize(filepath)
+            except OSError:
+                size = 0
+            if batch and (len(batch) >= self.batch_files or batch_size + size > self.batch_bytes):
+                yield batch
+                batch = list()
+                batch_size = 0
+            batch.append(filepath)
+            batch_size += size
+        if batch:
+            yield batch
+
+    def count_file(self, filepath, args_dict, data=None):
+        """!
+        @brief Gets the statistics of a file.
+        Measures the file counted along the way with --stats.
 
         @param filepath The absolute or relative path to the file.
+        @param args_dict The dictionary of user-side arguments.
+        @param data The content of the file already read (--prefetch), None to read it.
+        @return Returns the record of occurrences (metric key => number).
         """
-        filename, fileext = os.path.splitext(filepath)
-        # only including .c and .h files
-        if fileext == '.c' or fileext == '.h':
-            self.files_list.append(str(filepath))
+        stats = self.get_stats(args_dict)
+        if stats is None:
+            return self.read_file(filepath, args_dict, data)
+        started = time.perf_counter()
+        record = self.read_file(filepath, args_dict, data)
+        try:
+            size = os.path.getsize(filepath)
+        except OSError:
+            size = 0
+        stats.add_file(filepath, time.perf_counter() - started, size)
+        return record
 
-    def process_file(self, filepath, args_dict):
+    def read_file(self, filepath, args_dict, data=None):
         """!
-        @brief Gets .c or .h filepaths.
+        @brief Reads a file and counts the occurrences in it.
         Reads the file pointed to by the filepath passed and executes
-        the appropriate parsing function based on user-side arguments.
+        all the parsing functions requested by user-side arguments
+        over a single read of the file.
 
         @param filepath The absolute or relative path to the file.
         @param args_dict The dictionary of user-side arguments.
-        @return Returns the number of occurrences to the caller.
-        """
-        # opening the file to read in the specified encoding
-        filehandle = open(filepath, 'r', encoding='iso-8859-2')
-        file_content = filehandle.read()
-        output_file_handle = None
-        if args_dict['output_file'] is not None:
-            # opening the file to write to in the specified encoding
-            output_file_handle = open(args_dict['output_file'], 'a', encoding='iso-8859-2')
-
-        # handling formatted output
-        for item in self.files_list:
-            if args_dict['no_abs_path'] is False:
-                if self.maxlen < len(os.path.abspath(item)):
-                    self.maxlen = len(os.path.abspath(item))
-            else:
-                if self.maxlen < len(os.path.basename(item)):
-                    self.maxlen = len(os.path.basename(item))
+        @param data The content of the file already read (--prefetch, never with a cache), None to read it.
+        @return Returns the record of occurrences (metric key => number).
+        """
+        # read ahead by get_contents
+        if data is not None:
+            return self.count_content(data, args_dict)
 
-        file_occurrences = 0
-        ### WORD/STRING OCCURRENCES ###
-        if args_dict['word_search'] is not None:
-            file_occurrences = self.get_number_of_occurrences(file_content, args_dict['word_search'])
-            # print with absolute path
-            if args_dict['no_abs_path'] is False:
-                filepath = os.path.abspath(filepath)
-            else:
-                filepath = os.path.basename(filepath)
-            if len(str(file_occurrences)) > self.maxlen_num:
-                self.maxlen_num = len(str(file_occurrences))
-            # formatting the output
-            self.format_results(str(filepath), str(file_occurrences), output_file_handle)
-            return file_occurrences
-        ### END WORD/STRING OCCURRENCES ###
+        ### CACHED COUNTS ###
+        cache = self.get_cache(args_dict)
+        if cache is not None:
+            cache_path = os.path.abspath(filepath)
+            cache_keys = self.get_cache_keys(args_dict)
+            stat = os.stat(filepath)
+            # the same file as last time, no need to even read it
+            with self.measure('cache', 0):
+                digest = cache.get_digest(cache_path, stat)
+                if digest is not None:
+                    cached = cache.get_counts(digest, cache_keys.values())
+                    if cached is not None:
+                        cache.touch(cache_path)
+                        return self.get_cached_counts(cached, cache_keys)
+        ### END CACHED COUNTS ###
+
+        with open(filepath, 'rb') as filehandle:
+            ### STREAMING BIG FILES ###
+            chunk_size = args_dict['chunk_size']
+            size = os.fstat(filehandle.fileno()).st_size
+            if chunk_size and size > chunk_size:
+                if cache is not None:
+                    with self.measure('cache', size):
+                        digest = get_file_digest(filehandle, chunk_size)
+                        cached = cache.get_counts(digest, cache_keys.values())
+                        if cached is not None:
+                            cache.put(cache_path, stat, digest)
+                            return self.get_cached_counts(cached, cache_keys)
+                    filehandle.seek(0)
+                record = self.count_stream(filehandle, args_dict, size)
+                if cache is not None:
+                    with self.measure('cache', 0):
+                        cache.put(cache_path, stat, digest, self.get_counts_to_cache(record, cache_keys))
+                return record
+            ### END STREAMING BIG FILES ###
+
+            # the pages of a mapped file are only read while being lexed
+            with self.measure('read', size):
+                data = self.map_file(filehandle)
+            try:
+                ### CACHED CONTENT ###
+                if cache is not None:
+                    # the same content under a different identity (touched, copied, checked out again)
+                    with self.measure('cache', len(data)):
+                        digest = get_content_digest(data)
+                        cached = cache.get_counts(digest, cache_keys.values())
+                        if cached is not None:
+                            cache.put(cache_path, stat, digest)
+                            return self.get_cached_counts(cached, cache_keys)
+                ### END CACHED CONTENT ###
+
+                record = self.count_content(data, args_dict)
+            finally:
+                if isinstance(data, mmap.mmap):
+                    data.close()
+
+        if cache is not None:
+            with self.measure('cache', 0):
+                cache.put(cache_path, stat, digest, self.get_counts_to_cache(record, cache_keys))
+        return record
+
+    def count_archive(self, filepath, args_dict):
+        """!
+        @brief Counts the occurrences in the files of an archive.
+        The members are read straight from the archive one after
+        another (in the main process, whatever the jobs), the same
+        rules as for walking a directory tell which of them are
+        counted. A member is printed as the path to the archive
+        followed by the path of the member inside it.
+
+        @param filepath The path to the tar or zip archive.
+        @param args_dict The dictionary of user-side arguments.
+        @return Yields tuples of the path of the member and its record of occurrences.
+        """
+        exclude = self.get_glob_regex(args_dict['exclude'])
+        include = self.get_glob_regex(args_dict['include'])
+        members = iterate_members(filepath, lambda relpath: self.is_path_walked(relpath, args_dict, exclude, include)
+                                  and self.is_in_shard(filepath + '/' + relpath, args_dict))
+        stats = self.get_stats(args_dict)
+        if stats is not None:
+            members = self.measure_walk(members)
+        try:
+            for relpath, size, member_handle in members:
+                started = time.perf_counter()
+                record = self.count_member(member_handle, args_dict, size)
+                member_path = filepath + '/' + relpath
+                if stats is not None:
+                    stats.add_file(member_path, time.perf_counter() - started, size)
+                yield member_path, record
+        except archive_errors as error:
+            raise ArchiveError('The archive ' + filepath + ' cannot be read (' + str(error) + ').') from error
+
+    def count_member(self, filehandle, args_dict, size):
+        """!
+        @brief Gets the statistics of a member of an archive.
+        A member bigger than chunk_size is read in chunks just like
+        a big file.
 
-        # removing macros
-        file_content = self.remove_macros(file_content)
+        @param filehandle The file object of the member, opened in binary mode.
+        @param args_dict The dictionary of user-side arguments.
+        @param size The size of the member in bytes.
+        @return Returns the record of occurrences (metric key => number).
+        """
+        chunk_size = args_dict['chunk_size']
+        if chunk_size and size > chunk_size:
+            return self.count_stream(filehandle, args_dict, size)
+        with self.measure('read', size):
+            data = filehandle.read()
+        return self.count_content(data, args_dict)
+
+    def map_file(self, filehandle):
+        """!
+        @brief Maps a file into memory.
+        The content is then read by the operating system on demand
+        instead of being copied into the memory of the process.
 
-        number_operators = 0
-        ### OPERATORS ###
+        @param filehandle The file opened in binary mode.
+        @return Returns the mmap object (empty bytes for an empty file, which cannot be mapped).
+        """
+        if os.fstat(filehandle.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(filehandle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def count_content(self, data, args_dict):
+        """!
+        @brief Gets the statistics of a file content.
+        Executes all the parsing functions requested by user-side
+        arguments over the raw bytes of the content.
+
+        @param data The bytes of the file (bytes, mmap or any other buffer).
+        @param args_dict The dictionary of user-side arguments.
+        @return Returns the record of occurrences (metric key => number).
+        """
+        self.get_stats(args_dict)
+        # reading in text mode used to translate the newlines, only the files with CRs are copied
+        if data.find(b'\r') != -1:
+            data = data[:].replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+
+        counters = self.get_counters(args_dict)
+        self.feed_counters(counters, data, data, ScanState(), True)
+        return self.get_counted(counters, args_dict)
+
+    def count_stream(self, filehandle, args_dict, size):
+        """!
+        @brief Gets the statistics of a file read in chunks.
+        Reads the file chunk_size bytes at a time, the lexer and the
+        counters carry their state over from one chunk to the next,
+        so the memory used depends on the size of a chunk instead of
+        the size of the file and the counts stay the same.
+
+        @param filehandle The file opened in binary mode.
+        @param args_dict The dictionary of user-side arguments.
+        @param size The size of the file in bytes.
+        @return Returns the record of occurrences (metric key => number).
+        """
+        chunk_size = args_dict['chunk_size']
+        counters = self.get_counters(args_dict)
+        scan = ScanState()
+        # the part of the content the lexer has not finished with
+        content = b''
+        # a CR which may be followed by a LF at the start of the next chunk
+        pending = b''
+        # bytes of the file read so far
+        position = 0
+        final = False
+        while not final:
+            with self.measure('read', min(chunk_size, max(size - position, 0))):
+                chunk = filehandle.read(chunk_size)
+            position += len(chunk)
+            final = len(chunk) < chunk_size
+            chunk = pending + chunk
+            pending = b''
+            if not final and chunk.endswith(b'\r'):
+                chunk, pending = chunk[:-1], b'\r'
+            if chunk.find(b'\r') != -1:
+                chunk = chunk.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+
+            content = content + chunk
+            self.feed_counters(counters, content, chunk, scan, final)
+            keep = max(scan.position - self.lexer.context, 0)
+            content = content[keep:]
+            scan.position -= keep
+        return self.get_counted(counters, args_dict)
+
+    def get_counters(self, args_dict):
+        """!
+        @brief Prepares the counters of the metrics requested.
+
+        @param args_dict The dictionary of user-side arguments.
+        @return Returns the dictionary of metric key => list of counters.
+        """
+        counters = dict()
+
+        ### KEYWORDS ###
+        if args_dict['all_keywords'] is True:
+            counters['all_keywords'] = [WordCounter(self.identifier_regex, self.identifier_run, self.keywords_set,
+                                                    True)]
+        ### END KEYWORDS ###
+
+        ### OPERATORS ###
         if args_dict['simp_ops'] is True:
-            number_operators = self.get_number_of_operators(file_content)
-            if args_dict['no_abs_path'] is False:
-                filepath = os.path.abspath(filepath)
+            # pointer declarations are removed first, the operators are counted in what is left
+            if args_dict['operator_histogram'] is True:
+                operators = TokenCounter(self.operator_regex, self.operator_margin,
+                                         [operator.encode() for operator in self.operators_list])
             else:
-                filepath = os.path.basename(filepath)
-            if len(str(number_operators)) > self.maxlen_num:
-                self.maxlen_num = len(str(number_operators))
-            # formatting the output
-            self.format_results(str(filepath), str(number_operators), output_file_handle)
-            return number_operators
+                operators = RegexCounter(self.operator_regex, self.operator_margin, windowed=True)
+            counters['simp_ops'] = [DeclaratorFilter(self.pointer_start_regex, self.declarator_regex,
+                                                     self.declarator_gap_regex, self.pointer_margin, operators)]
         ### END OPERATORS ###
 
-        identifiers_occurrences = 0
         ### IDENTIFIERS OCCURRENCES ###
         if args_dict['identifiers'] is True:
-            identifiers_occurrences = self.get_number_of_identifiers(file_content)
-            # print with absolute path
-            if args_dict['no_abs_path'] is False:
-                filepath = os.path.abspath(filepath)
-            else:
-                filepath = os.path.basename(filepath)
-            if len(str(identifiers_occurrences)) > self.maxlen_num:
-                self.maxlen_num = len(str(identifiers_occurrences))
-            # formatting the output
-            self.format_results(str(filepath), str(identifiers_occurrences), output_file_handle)
-            return identifiers_occurrences
+            # known C keywords are not counted
+            words = TopCounter(args_dict['top_capacity']) if args_dict['top_identifiers'] is not None else None
+            counters['identifiers'] = [WordCounter(self.identifier_regex, self.identifier_run, self.keywords_set,
+                                                   False, words)]
         ### END IDENTIFIERS OCCURRENCES ###
 
-        keyword_file_occurrences = 0
-        ### KEYWORDS ###
-        if args_dict['all_keywords'] is True:
-            keyword_file_occurrences = self.get_number_of_keywords(file_content)
-            # print with absolute path
-            if args_dict['no_abs_path'] is False:
-                filepath = os.path.abspath(filepath)
+        ### WORD/STRING OCCURRENCES ###
+        if args_dict['word_search'] is not None:
+            patterns = args_dict['word_search']
+            if len(patterns) <= self.search_regexes:
+                counters['word_search'] = list()
+                for pattern in patterns:
+                    regex = self.get_search_regex(pattern)
+                    if regex is None:
+                        regex = self.nothing_regex
+                    counters['word_search'].append(RegexCounter(regex, len(pattern) + 1))
             else:
-                filepath = os.path.basename(filepath)
-            if len(str(keyword_file_occurrences)) > self.maxlen_num:
-                self.maxlen_num = len(str(keyword_file_occurrences))
-            # formatting the output
-            self.format_results(str(filepath), str(keyword_file_occurrences), output_file_handle)
-            return keyword_file_occurrences
-        ### END KEYWORDS ###
+                # all the patterns in a single pass over the content
+                counters['word_search'] = [PatternCounter([self.get_search_bytes(pattern) for pattern in patterns],
+                                                          self.word_class, self.word_regex)]
+        ### END WORD/STRING OCCURRENCES ###
 
-        number_multiline, number_inline = 0, 0
         ### COMMENTS ###
         if args_dict['comments'] is True:
-            number_inline = self.get_inline_comments_number(file_content)
-            number_multiline = self.get_multiline_comments_number(file_content)
-            # print with absolute path
-            if args_dict['no_abs_path'] is False:
-                filepath = os.path.abspath(filepath)
-            else:
-                filepath = os.path.basename(filepath)
-            # formatting the output
-            if len(str(number_multiline + number_inline)) > self.maxlen_num:
-                self.maxlen_num = len(str(number_multiline + number_multiline))
-            self.format_results(str(filepath), str(number_multiline + number_inline), output_file_handle)
-            return number_multiline + number_inline
+            # inline and multiline comments are matched independently of each other
+            counters['comments'] = [InlineCommentCounter(), BlockCommentCounter(self.comment_opener_regex)]
         ### END COMMENTS ###
 
-        # cleaning up
-        if args_dict['output_file'] is not None:
-            output_file_handle.close()
-        filehandle.close()
+        return counters
 
-    def get_number_of_identifiers(self, file_content):
+    def feed_counters(self, counters, content, chunk, scan, final):
         """!
-        @brief Matches all C identifiers.
-        Matches all C identifiers and returns the number of occurrences.
-        Does not look into comments or strings.
+        @brief Feeds the next part of a file content to the counters.
+        A single scan of the lexer splits the content into the views
+        the metrics need, the views are then built one at a time.
 
-        @param file_content The content of the file passed.
-        @return Returns the number of occurrences of C identifiers.
+        @param counters The counters returned by get_counters.
+        @param content The content the lexer has not finished with (the chunk included).
+        @param chunk The next chunk of the content.
+        @param scan The ScanState of the lexer, updated to where the lexer stopped.
+        @param final Whether this is the last chunk of the content.
         """
-        # removing strings and comments
-        file_content = self.remove_content(True, True, file_content)
-        # and also char literals
-        file_content = self.remove_char_literals(file_content)
-        # matching based on standard C naming conventions
-        regex = re.compile(r'\b[_a-zA-Z][_a-zA-Z0-9]*\b')
-        matches = re.findall(regex, file_content)
-        # list comprehension to remove known C keywords from the final list
-        identifiers = [match for match in matches if match not in self.keywords_list]
-        return len(identifiers)
+        views = list()
+        for metric in self.metrics_list:
+            if metric in counters and self.metric_views[metric] not in views:
+                views.append(self.metric_views[metric])
+
+        ### SPLITTING THE CONTENT ###
+        spans = dict()
+        if views != [None]:
+            lexed = [view for view in views if view is not None]
+            with self.measure('lex', len(chunk)):
+                tokens = self.lexer.tokenize(content, scan, final)
+                spans = dict(zip(lexed, self.lexer.get_spans(tokens, lexed, len(content))))
+        else:
+            scan.position = len(content)
+        ### END SPLITTING THE CONTENT ###
 
-    def get_number_of_keywords(self, file_content):
+        for view in views:
+            if view is None:
+                piece = chunk
+            else:
+                with self.measure('views', len(chunk)):
+                    piece = self.lexer.join_spans(content, spans[view])
+            for metric in counters:
+                if self.metric_views[metric] == view:
+                    with self.measure(metric, len(piece)):
+                        for counter in counters[metric]:
+                            counter.feed(piece, final)
+            # one view at a time, the previous one is dropped before the next one is joined
+            del piece
+
+    def get_counted(self, counters, args_dict):
+        """!
+        @brief Collects the numbers counted.
+        With --histogram, the number of each of the keywords is stored
+        in the record too, under 'keyword:<keyword>'. So is the number
+        of each of the operators with --operator-histogram, under
+        'operator:<operator>', and the number of each of the patterns
+        searched for, if there are more of them, under
+        'pattern:<pattern>'. With --top-identifiers, the summary
+        of the identifiers (TopCounter) is under 'top_identifiers'.
+
+        @param counters The counters returned by get_counters.
+        @param args_dict The dictionary of user-side arguments.
+        @return Returns the record of occurrences (metric key => number).
+        """
+        record = dict([(metric, sum([counter.get_number() for counter in counters[metric]])) for metric in counters])
+        if args_dict['histogram'] is True:
+            histogram = counters['all_keywords'][0].histogram
+            for keyword in self.keywords_list:
+                record['keyword:' + keyword] = histogram[keyword.encode()]
+        if args_dict['operator_histogram'] is True:
+            histogram = counters['simp_ops'][0].target.histogram
+            for operator in self.operators_list:
+                record['operator:' + operator] = histogram[operator.encode()]
+        if args_dict['word_search'] is not None and len(args_dict['word_search']) > 1:
+            numbers = [number for counter in counters['word_search'] for number in counter.get_numbers()]
+            for pattern, number in zip(args_dict['word_search'], numbers):
+                record['pattern:' + pattern] = number
+        if args_dict['top_identifiers'] is not None:
+            record['top_identifiers'] = counters['identifiers'][0].words
+        return record
+
+    def get_cache(self, args_dict):
         """!
-        @brief Matches all C keywords.
-        Matches all C keywords and returns the number of occurrences.
-        Does not look into comments or strings.
+        @brief Gets the persistent cache.
+        Opens the cache the first time it is needed.
 
-        @param file_content The content of the file passed.
-        @return Returns the number of occurrences of C keywords.
+        @param args_dict The dictionary of user-side arguments.
+        @return Returns the Cache object or None if caching is not enabled.
         """
-        # removing strings and comments
-        file_content = self.remove_content(True, True, file_content)
+        # the counts of each of the identifiers are not cached
+        if self.cache is None and args_dict['cache_dir'] is not None and args_dict['top_identifiers'] is None:
+            signature = self.version + ':' + ','.join(self.keywords_list)
+            self.cache = Cache(args_dict['cache_dir'], signature, args_dict['cache_size'])
+        return self.cache
 
-        found_keywords = list()
-        for keyword in self.keywords_list:
-            regex = re.compile(r'\b' + re.escape(keyword) + r'\b')
-            matches = re.findall(regex, file_content)
-            if len(matches) != 0:
-                found_keywords.append(matches)
+    def close_cache(self, args_dict, evict=False):
+        """!
+        @brief Writes and closes the persistent cache.
 
-        # flattening the list to be able to use len to get the number of occurrences
-        flat_found_keywords = list(itertools.chain.from_iterable(found_keywords))
-        return len(flat_found_keywords)
+        @param args_dict The dictionary of user-side arguments.
+        @param evict True – drop the least recently used files over the limit/False – keep all
+        """
+        cache = self.get_cache(args_dict)
+        if cache is None:
+            return
+        if evict is True:
+            cache.evict()
+        cache.close()
+        self.cache = None
 
-    def get_number_of_operators(self, file_content):
+    def get_stats(self, args_dict):
         """!
-        @brief Matches all C keywords.
-        Matches all C keywords and returns the number of occurrences.
-        Does not look into comments or strings.
+        @brief Gets the stats of the stages.
+        Starts measuring the first time they are needed.
 
-        @param file_content The content of the file passed.
-        @return Returns the number of occurrences of C keywords.
+        @param args_dict The dictionary of user-side arguments.
+        @return Returns the Stats object or None if the stats are not requested.
         """
-        # removing macros
-        file_content = self.remove_macros(file_content)
-        # removing comments and strings
-        file_content = self.remove_content(True, True, file_content)
-        # removing char literals
-        file_content = self.remove_char_literals(file_content)
-        # finally removing pointers
-        file_content = self.remove_pointers(file_content)
+        if self.stats is None and args_dict['stats'] is not None:
+            self.stats = Stats(args_dict['stats_top'])
+        return self.stats
 
-        # regexing for the equal sign prefix operators, double char operators and single char operators
-        regex_operators = re.compile(r'((?:\+|-|\*|\/|%|<<|>>|<|>|!|&|\||\^)=|\+\+|--|\|\||&&|<<|>>|->|==|(?:\+|-|\*|\/|%|&|=|\||\.[_a-zA-Z\s]|>|<|!|~|\^))')
-        results_operators = re.findall(regex_operators, file_content)
+    def measure(self, stage, size):
+        """!
+        @brief Measures a stage (--stats) for the duration of a with block.
 
-        return len(results_operators)
+        @param stage The name of the stage.
+        @param size The number of bytes the stage processes.
+        @return Returns the context manager.
+        """
+        if self.stats is None:
+            return contextlib.nullcontext()
+        return self.stats.measure(stage, size)
 
-    def get_number_of_occurrences(self, file_content, find):
+    def get_cache_keys(self, args_dict):
         """!
-        @brief Matches a word/string passed.
-        Matches all exact occurrences of the string passed in the arguments.
-        Look everywhere (macros, comments, strings).
+        @brief Gets the cache keys of the metrics requested.
+        The searched pattern is a part of the key of -w. With more
+        patterns, only the number of each of them is cached, the key
+        of a pattern being the same as if it was searched for alone.
 
-        @param file_content The content of the file passed.
-        @param find The word/string to match.
-        @return Returns the number of occurrences of the string.
+        @param args_dict The dictionary of user-side arguments.
+        @return Returns the dictionary of metric key => cache key.
         """
-        regex = re.compile(r'\b' + re.escape(find) + r'\b')
-        results = re.findall(regex, file_content)
-        return len(results)
+        cache_keys = dict()
+        for metric in self.get_metrics(args_dict):
+            if metric == 'word_search':
+                if len(args_dict['word_search']) == 1:
+                    cache_keys[metric] = metric + ':' + args_dict['word_search'][0]
+                else:
+                    for pattern in args_dict['word_search']:
+                        cache_keys['pattern:' + pattern] = metric + ':' + pattern
+            else:
+                cache_keys[metric] = metric
+        if args_dict['histogram'] is True:
+            for keyword in self.keywords_list:
+                cache_keys['keyword:' + keyword] = 'keyword:' + keyword
+        if args_dict['operator_histogram'] is True:
+            for operator in self.operators_list:
+                cache_keys['operator:' + operator] = 'operator:' + operator
+        return cache_keys
+
+    def get_cached_counts(self, cached, cache_keys):
+        """!
+        @brief Turns the cached counts back into a record.
+
+        @param cached The dictionary of cache key => number returned by the cache.
+        @param cache_keys The dictionary of metric key => cache key.
+        @return Returns the record of occurrences (metric key => number).
+        """
+        record = dict([(metric, cached[cache_keys[metric]]) for metric in cache_keys])
+        # the total of more patterns is not cached by itself
+        numbers = [record[metric] for metric in record if metric.startswith('pattern:')]
+        if numbers:
+            record['word_search'] = sum(numbers)
+        return record
+
+    def get_counts_to_cache(self, record, cache_keys):
+        """!
+        @brief Turns a record into the counts to cache.
 
-    def get_multiline_comments_number(self, file_content):
+        @param record The record of occurrences (metric key => number).
+        @param cache_keys The dictionary of metric key => cache key.
+        @return Returns the dictionary of cache key => number.
+        """
+        return dict([(cache_keys[metric], record[metric]) for metric in cache_keys])
+
+    def process_file(self, filepath, args_dict, record=None):
         """!
-        @brief Matches C-style multiline comments.
-        Matches all the C multiline comments (/* */) and returns the number.
+        @brief Gets the statistics of a file and stores them.
+        Counts the occurrences in the file (unless they were already
+        counted elsewhere) and stores them along with the path to
+        print. The output is only formatted once all the files are
+        processed, see add_result.
 
-        @param file_content The content of the file passed.
-        @return Returns the number of chars found in multiline comments.
+        @param filepath The absolute or relative path to the file.
+        @param args_dict The dictionary of user-side arguments.
+        @param record What count_file returned for the file, None to count it here.
+        @return Returns the record of occurrences (metric key => number) to the caller.
         """
-        comment_content = self.match_multiline_comments(file_content, False)
-        return len(comment_content)
+        if record is None:
+            record = self.count_file(filepath, args_dict)
+        self.add_result(self.get_printed_path(filepath, args_dict), record)
+        return record
 
-    def get_inline_comments_number(self, file_content):
+    def add_result(self, filepath, record):
         """!
-        @brief Matches C-style inline comments.
-        Matches all the C inline comments (//) and returns the number.
+        @brief Stores the statistics of a file.
 
-        @param file_content The content of the file passed.
-        @return Returns the number of chars found in inline comments.
+        @param filepath The filepath to print.
+        @param record The record of occurrences (metric key => number).
         """
-        comment_content = self.match_inline_comments(file_content, False)
-        return len(comment_content)
+        self.results.append((filepath, record))
+        # widening the columns right away, so the results are not gone through again, the widest number
+        # sets the width whatever the order of the files
+        self.maxlen = max(self.maxlen, len(filepath))
+        for metric in self.metrics_list:
+            if metric in record:
+                self.maxlen_num[metric] = max(self.maxlen_num.get(metric, 0), len(str(record[metric])))
 
-    def format_results(self, filepath, number, output_file_handle):
+    def process_top_identifiers(self, record, args_dict):
         """!
-        @brief Write to file or stdout.
-        Decides if the user wants the results printed into a file
-        or onto the standard output.
+        @brief Adds the identifiers of a file to those of all the files (--top-identifiers).
+        The summary in the record is then replaced by the most
+        frequent identifiers of the file.
 
-        @param string The string to print.
-        @param output_file_handle The filehandle of a file (no output file == None)
+        @param record The record of occurrences with the summary of the identifiers, updated in place.
+        @param args_dict The dictionary of user-side arguments.
         """
-        num_padding = ''
-        # aligning the filename
+        if args_dict['top_identifiers'] is None:
+            return
+        if self.top_identifiers is None:
+            self.top_identifiers = TopCounter(args_dict['top_capacity'])
+        self.top_identifiers.merge(record['top_identifiers'])
+        record['top_identifiers'] = record['top_identifiers'].get_top(args_dict['top_identifiers'])
+
+    def get_result_key(self, result):
+        """!
+        @brief Gets the key the results are sorted by.
+        Sorting the formatted lines used to order them by the filepath,
+        files printed under the same name by their (right-aligned)
+        numbers.
+
+        @param result The (filepath to print, record of occurrences) tuple.
+        @return Returns the key.
+        """
+        return result[0], [result[1][metric] for metric in self.metrics_list if metric in result[1]]
+
+    def clear_results(self):
+        """!
+        @brief Drops the results of all the files processed (along with their temporary files).
+        """
+        self.results.close()
+        self.maxlen = 0
+        self.maxlen_num = dict()
+
+    def get_printed_path(self, filepath, args_dict):
+        """!
+        @brief Gets the filepath the way it is printed.
+
+        @param filepath The absolute or relative path to the file.
+        @param args_dict The dictionary of user-side arguments.
+        @return Returns the absolute path, or the filename with -p.
+        """
+        # print with absolute path
+        if args_dict['no_abs_path'] is False:
+            filepath = os.path.abspath(filepath)
+        else:
+            filepath = os.path.basename(filepath)
+        return str(filepath)
+
+    def process_delta(self, filepath, args_dict, metrics, old_record, record):
+        """!
+        @brief Stores the change of the counts of a file (--since).
+
+        @param filepath The absolute or relative path to the file.
+        @param args_dict The dictionary of user-side arguments.
+        @param metrics The list of metric keys, one column each.
+        @param old_record The record of the file in the baseline, None if it was not there.
+        @param record The record of the file now, None if it was deleted.
+        """
+        delta = dict()
+        for metric in metrics:
+            delta[metric] = ((record[metric] if record is not None else 0) -
+                             (old_record[metric] if old_record is not None else 0))
+        self.deltas.append((self.get_printed_path(filepath, args_dict), delta))
+
+    def get_search_bytes(self, find):
+        """!
+        @brief Encodes a word/string the way the files are encoded.
+
+        @param find The word/string to match.
+        @return Returns the bytes, None if the string cannot occur in an ISO-8859-2 file.
+        """
+        try:
+            return find.encode('iso-8859-2')
+        except UnicodeEncodeError:
+            return None
+
+    def get_search_regex(self, find):
+        """!
+        @brief Compiles the bytes regex matching a word/string.
+        The bytes counterpart of \\b<find>\\b over the decoded content,
+        a word boundary depends on whether the string starts (ends)
+        with a word character.
+
+        @param find The word/string to match.
+        @return Returns the compiled regex, None if the string cannot occur in an ISO-8859-2 file.
+        """
+        pattern = self.get_search_bytes(find)
+        if pattern is None:
+            return None
+        pattern = re.escape(pattern)
+        if re.match(r'\w', find[0]):
+            pattern = b'(?<!' + self.word_class + b')' + pattern
+        else:
+            pattern = b'(?<=' + self.word_class + b')' + pattern
+        if re.match(r'\w', find[-1]):
+            pattern = pattern + b'(?!' + self.word_class + b')'
+        else:
+            pattern = pattern + b'(?=' + self.word_class + b')'
+        return re.compile(pattern)
+
+    def format_results(self, filepath, record):
+        """!
+        @brief Formats a line of the output.
+        Aligns the filepath to the left and the numbers to the right
+        using the widths of all the results (add_result).
+
+        @param filepath The filepath to print.
+        @param record The record of occurrences (metric key => number), one column each.
+        @return Returns the formatted line.
+        """
+        # aligning the filename
         filename_padding = ''.join([' ' for s in range(self.maxlen - len(filepath))])
-        # accounting for right align of the resulting number
-        num_padding = ''.join([' ' for s in range(self.maxlen_num - len(str(number)))])
-        self.result_strings.append(filepath + filename_padding + ' ' + num_padding + number + '\n')
-
-    def remove_macros(self, string):
-        """!
-        @brief Removes all C preprocessor macros.
-        Matches all the C macros and removes them (substitutes with '').
-
-        @param string The content of the file passed.
-        @return Returns the edited content of the file.
-        """
-        # bool value to know if we're inside a macro
-        inside_macro = False
-        # list for stored non-macro chars
-        final_content = list()
-        for index in range(0, len(string)):
-            # macro start
-            if string[index] == '#':
-                inside_macro = True
-            # macro end if multiline \ isn't present
-            if inside_macro is True and string[index] == '\n' and string[index-1] != '\\':
-                inside_macro = False
-            # only store the content that is not a macro
-            if inside_macro is False:
-                final_content.append(string[index])
-        # make a string out of the char list
-        final_content = ''.join(final_content)
-        # returning the final string
-        return final_content
-
-    def remove_char_literals(self, string):
-        """!
-        @brief Removes all C char literals.
-        Matches all the C char literals and removes them (substitutes with '').
-
-        @param string The content of the file passed.
-        @return Returns the edited content of the file.
-        """
-        # bool value to know if we're inside a char literal
-        inside_char = False
-        # bool value to know we just passed the first single quote
-        first_pass = False
-        final_content = list()
-        # for every char of the content passed
-        for index in range(0, len(string)):
-            # start of the char literal
-            if string[index] == '\'' and first_pass is False:
-                inside_char = True
-                first_pass = True
-                continue
-            # end of the char literal
-            if string[index] == '\'':
-                inside_char = False
-                first_pass = False
-                continue
-            # storing the content outside of the char literal
-            if inside_char is False:
-                final_content.append(string[index])
-        # joining the list contents into a string
-        final_content = ''.join(final_content)
-        # returning the final string
-        return final_content
-
-    def remove_strings(self, string):
-        """!
-        @brief Removes all C strings ("").
-        Matches all the C strings and removes them (substitutes with '').
-
-        @param string The content of the file passed.
-        @return Returns the edited content of the file.
-        """
-        # bool value to know if we're inside a string
-        inside_string = False
-        # bool value to know we just passed the first single quote
-        first_pass = False
-        final_content = list()
-        # for every char of the content passed
-        for index in range(0, len(string)):
-            # start of the string
-            if string[index] == '"' and first_pass is False:
-                inside_string = True
-                first_pass = True
-                continue
-            # end of the string
-            if string[index] == '"':
-                inside_string = False
-                first_pass = False
+        columns = list()
+        for metric in self.metrics_list:
+            if metric not in record:
                 continue
-            # storing the content outside of the string
-            if inside_string is False:
-                final_content.append(string[index])
-        # joining the list contents into a string
-        final_content = ''.join(final_content)
-        # returning the final string
-        return final_content
-
-    def remove_pointers(self, file_content):
-        """!
-        @brief Removes all C pointers.
-        Matches all the C pointers and removes them (substitutes with '').
-
-        @param string The content of the file passed.
-        @return Returns the edited content of the file.
-        """
-        # regex to match all the pointers
-        final_content = re.sub(r'\b(_Bool|_Complex|char|const|double|float|int|long|short|'
-                               'void)(\s*,?\s*\(?\s*\*+\s*'
-                               '\(?\w*\)?)+', '\\1', file_content)
-        # returning the final string
-        return final_content
-
-    def remove_content(self, comments, strings, file_content):
-        """!
-        @brief Removes specified parts of C file content.
-        Matches the specified C file content and removes it.
-
-        @param comments True – remove/False – do not remove
-        @param strings True – remove/False – do not remove
-        @return Returns the edited content of the file.
-        """
-        # if we want to remove comments
-        if comments is True:
-            file_content = self.match_inline_comments(file_content, True)
-            file_content = self.match_multiline_comments(file_content, True)
-        # if we want to remove string
-        if strings is True:
-            file_content = self.remove_strings(file_content)
-        # return the edited content
-        return file_content
-
-    def match_inline_comments(self, string, remove):
-        """!
-        @brief Matches (and removes) all C inline comments (//).
-        Matches all the C inline comments.
-
-        @param string The content of the file passed.
-        @param remove True – remove/False – match
-        @return Returns the edited content of the file.
-        """
-        # bool value to know if we're inside an inline comment
-        inside_inline_comment = False
-        final_content = list()
-        # for each char of the content string
-        for index in range(0, len(string)):
-            # inline comment start
-            if string[index] == '/' and string[index+1] == '/':
-                inside_inline_comment = True
-            # end of the inline comment
-            if string[index] == '\n':
-                if inside_inline_comment is True:
-                    # appending the newline character too
-                    final_content.append(string[index])
-                inside_inline_comment = False
-            # if we want to remove it
-            if remove is True:
-                if inside_inline_comment is False:
-                    # appending only the non-comment sections
-                    final_content.append(string[index])
-            # if we want to match it
-            else:
-                if inside_inline_comment is True:
-                    # appending only the comment chars
-                    final_content.append(string[index])
-        # joining the char list into a string
-        final_content = ''.join(final_content)
-        # returning the final string
-        return final_content
-
-    def match_multiline_comments(self, string, remove):
-        """!
-        @brief Matches (and removes) all C multiline comments (/**/).
-        Matches all the C multiline comments.
-
-        @param string The content of the file passed.
-        @param remove True – remove/False – match
-        @return Returns the edited content of the file.
-        """
-        # bool value to know if we're inside an multiline comment
-        inside_multiline_comment = False
-        final_content = list()
-        # for each char of the content string
-        for index in range(0, len(string)):
-            # start multiline comment
-            if string[index] == '/' and string[index+1] == '*':
-                inside_multiline_comment = True
-            # end multiline comment
-            if string[index-1] == '/' and string[index-2] == '*':
-                inside_multiline_comment = False
-            # if we want to remove it
-            if remove is True:
-                if inside_multiline_comment is False:
-                    # appending only the non-comment sections
-                    final_content.append(string[index])
-            # if we want to match it
-            else:
-                if inside_multiline_comment is True:
-                    # appending only the comment chars
-                    final_content.append(string[index])
-        # joining the char list into a string
-        final_content = ''.join(final_content)
-        # returning the final string
-        return final_content
+            number = str(record[metric])
+            # accounting for right align of the resulting number
+            num_padding = ''.join([' ' for s in range(self.maxlen_num[metric] - len(number))])
+            columns.append(' ' + num_padding + number)
+        return filepath + filename_padding + ''.join(columns) + '\n'
+
+    def format_total(self, metrics, totals, output_file=None):
+        """!
+        @brief Formats the line of the total numbers.
+        Keeps the alignment of the original output: the 'CELKEM: '
+        text is padded to the width of the filepaths, a total wider
+        than the numbers above it sticks out to the right and a total
+        of two digits printed to stdout gets an extra space.
+
+        @param metrics The list of metric keys, one column each.
+        @param totals The dictionary of metric key => total number.
+        @param output_file The path to the output file, None for stdout.
+        @return Returns the formatted line.
+        """
+        total_text = 'CELKEM: '
+        total_padding = ''.join([' ' for s in range(self.maxlen - len(total_text))])
+        total_string = total_text + total_padding
+        for index, metric in enumerate(metrics):
+            number = str(totals[metric])
+            maxlen_num = self.maxlen_num.get(metric, 0)
+            num_padding = ''.join([' ' for s in range(maxlen_num - len(number))])
+            # the other columns are separated the same way the results are
+            if index > 0:
+                total_string += ' '
+            elif output_file is None and len(number) == 2 and maxlen_num != 1:
+                total_string += ' '
+            total_string += num_padding + number
+        return total_string + '\n'
+
+    def format_deltas(self, metrics):
+        """!
+        @brief Formats the changes of the counts since a commit (--since).
+        Lists each of the files added, modified or deleted with the
+        change of each of the columns, followed by the change of the
+        totals. The lines are sorted like the results.
+
+        @param metrics The list of metric keys, one column each.
+        @return Returns the list of the formatted lines.
+        """
+        totals = dict([(metric, 0) for metric in metrics])
+        rows = list()
+        for filepath, delta in sorted(self.deltas, key=lambda result: result[0]):
+            for metric in metrics:
+                totals[metric] += delta[metric]
+            rows.append([filepath] + ['%+d' % delta[metric] for metric in metrics])
+        rows.append(['CELKEM:'] + ['%+d' % totals[metric] for metric in metrics])
+
+        # aligning the filepaths to the left, the numbers to the right
+        lengths = [max([len(row[index]) for row in rows]) for index in range(len(metrics) + 1)]
+        lines = list()
+        for row in rows:
+            line = row[0] + ''.join([' ' for s in range(lengths[0] - len(row[0]))])
+            for index in range(1, len(row)):
+                num_padding = ''.join([' ' for s in range(lengths[index] - len(row[index]))])
+                line += ' ' + num_padding + row[index]
+            lines.append(line + '\n')
+        return lines
+
+    def format_histogram(self, prefix, names):
+        """!
+        @brief Formats the numbers of each of the keywords/patterns.
+        Lists the keywords (--histogram) or the patterns searched for
+        (more -w) found in each of the files, one per line, followed
+        by the totals of all of them. The lines are sorted like the
+        results, which are gone through twice – to measure the columns
+        and to format the lines.
+
+        @param prefix The prefix of their keys in the records ('keyword:' or 'pattern:').
+        @param names The list of the keywords/patterns.
+        @return Yields the formatted lines.
+        """
+        total_text = 'CELKEM:'
+        totals = dict([(name, 0) for name in names])
+        path_length = len(total_text)
+        for filepath, record in self.results:
+            for name in names:
+                number = record[prefix + name]
+                totals[name] += number
+                if number != 0:
+                    path_length = max(path_length, len(filepath))
+        # the totals are the widest numbers
+        lengths = (path_length, max([len(name) for name in names]), max([len(str(totals[name])) for name in names]))
+
+        for filepath, record in self.results:
+            for name in names:
+                number = record[prefix + name]
+                if number != 0:
+                    yield self.format_histogram_line(filepath, name, str(number), lengths)
+        for name in names:
+            yield self.format_histogram_line(total_text, name, str(totals[name]), lengths)
+
+    def format_top_identifiers(self, top):
+        """!
+        @brief Formats the most frequent identifiers (--top-identifiers).
+        Lists the most frequent identifiers of each of the files,
+        followed by those of all the files, aligned like a histogram.
+
+        @param top The list of [identifier, count] pairs of all the files.
+        @return Yields the formatted lines.
+        """
+        total_text = 'CELKEM:'
+        path_length = len(total_text)
+        name_length = max([len(name) for name, number in top] + [0])
+        # the totals may be estimates, lower than the counts of a file
+        num_length = max([len(str(number)) for name, number in top] + [1])
+        for filepath, record in self.results:
+            if record['top_identifiers']:
+                path_length = max(path_length, len(filepath))
+                name_length = max([name_length] + [len(name) for name, number in record['top_identifiers']])
+                num_length = max([num_length] + [len(str(number)) for name, number in record['top_identifiers']])
+        lengths = (path_length, name_length, num_length)
+
+        for filepath, record in self.results:
+            for name, number in record['top_identifiers']:
+                yield self.format_histogram_line(filepath, name, str(number), lengths)
+        for name, number in top:
+            yield self.format_histogram_line(total_text, name, str(number), lengths)
+
+    def format_histogram_line(self, filepath, name, number, lengths):
+        """!
+        @brief Formats a line of a histogram.
+        Aligns the filepath and the keyword/pattern to the left, the
+        number to the right.
+
+        @param filepath The filepath to print (or the 'CELKEM:' text).
+        @param name The keyword/pattern.
+        @param number The number as a string.
+        @param lengths The tuple of the widths of the three columns.
+        @return Returns the formatted line.
+        """
+        filename_padding = ''.join([' ' for s in range(lengths[0] - len(filepath))])
+        keyword_padding = ''.join([' ' for s in range(lengths[1] - len(name))])
+        num_padding = ''.join([' ' for s in range(lengths[2] - len(number))])
+        return filepath + filename_padding + ' ' + name + keyword_padding + ' ' + num_padding + number + '\n'
+
+
+def count_batch(task):
+    """!
+    @brief Counts the occurrences in a batch of files.
+    The entry point of the worker processes, it has to be
+    a module-level function to be usable by multiprocessing.
+
+    @param task The tuple of the list of filepaths and the dictionary of user-side arguments.
+    @return Returns the tuple of the list of tuples of the filepath and what count_file returned for it,
+    and the Stats of the batch (None without --stats).
+    """
+    batch, args_dict = task
+    parser = Parser()
+    records = [(filepath, parser.count_file(filepath, args_dict, data))
+               for filepath, data in parser.get_contents(batch, args_dict)]
+    parser.close_cache(args_dict)
+    return records, parser.stats
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+#CST:xvitas02
+
+"""!
+@package partial.py
+Results of a part of the files, merged into the whole report.
+
+This module splits the files into shards by a hash of their paths
+(--shard), so that each of the shards can be counted by another
+process or machine. The results of a shard are saved into a partial
+result file: the printed path and the record of each of its files,
+the widths of the report columns and the summary of the identifiers.
+The partial results of all the shards are then merged (--merge) into
+the report the whole run would have printed.
+"""
+
+import json
+import os
+import zlib
+from sketch import TopCounter
+
+
+def get_shard(filepath, count):
+    """!
+    @brief Tells which of the shards a file belongs to.
+    The path is hashed by CRC-32, which (unlike hash()) is the same
+    in every process and on every machine.
+
+    @param filepath The path to the file, as walked or listed.
+    @param count The number of the shards.
+    @return Returns the number of the shard, from 1 to count.
+    """
+    return zlib.crc32(os.fsencode(filepath)) % count + 1
+
+
+def check_shards(partials):
+    """!
+    @brief Checks that the partial results make up a whole run.
+
+    @param partials The list of the loaded Partial objects.
+    @return Returns None if each of the shards is there exactly once, the error message otherwise.
+    """
+    counts = set([partial.shard[1] for partial in partials])
+    if len(counts) != 1:
+        return 'The partial results were split into different numbers of shards.'
+    numbers = sorted([partial.shard[0] for partial in partials])
+    if numbers != list(range(1, counts.pop() + 1)):
+        return 'The partial results have to hold each of the shards exactly once (got ' + \
+               ', '.join([str(number) for number in numbers]) + ').'
+    return None
+
+
+class Partial:
+
+    def __init__(self, version, keys):
+        """!
+        @brief Starts with no records.
+
+        @param version The version of the counting rules (Parser.version).
+        @param keys The list of record keys the records hold.
+        """
+        self.version = version
+        self.keys = keys
+        # (number of the shard, number of the shards)
+        self.shard = None
+        # (printed filepath, record of occurrences) tuples in the order of the report
+        self.records = list()
+        # widths of the filepath column and of each of the metric columns, before the totals are known
+        self.maxlen = 0
+        self.maxlen_num = dict()
+        # number of the top identifiers listed and the summary of all the identifiers (--top-identifiers)
+        self.top_number = None
+        self.top_identifiers = None
+
+    def dumps(self):
+        """!
+        @brief Turns the partial result into the text of a partial result file.
+
+        @return Returns the JSON text (ASCII only, ending with a newline).
+        """
+        top = None
+        if self.top_identifiers is not None:
+            counts = sorted([[word.decode('iso-8859-2'), count] for word, count in self.top_identifiers.counts.items()])
+            top = {'number': self.top_number, 'capacity': self.top_identifiers.capacity,
+                   'error': self.top_identifiers.error, 'counts': counts}
+        return json.dumps({'version': self.version, 'shard': list(self.shard), 'keys': self.keys,
+                           'maxlen': self.maxlen, 'maxlen_num': self.maxlen_num, 'top_identifiers': top,
+                           'records': [list(result) for result in self.records]}) + '\n'
+
+    def load(self, filepath):
+        """!
+        @brief Loads a partial result file.
+
+        @param filepath The path to the partial result file.
+        @return Returns None if the partial result was loaded, the error message otherwise.
+        """
+        try:
+            with open(filepath, encoding='utf-8') as partial_handle:
+                content = json.load(partial_handle)
+            shard = tuple(content['shard'])
+            records = [(str(path), record) for path, record in content['records']]
+            maxlen = int(content['maxlen'])
+            maxlen_num = dict(content['maxlen_num'])
+            top = content['top_identifiers']
+        except (OSError, ValueError, TypeError, KeyError):
+            return 'The partial result ' + filepath + ' cannot be read.'
+        if content.get('version') != self.version:
+            return 'The partial result ' + filepath + ' was saved by a different version of the parser.'
+        if content.get('keys') != self.keys or (top is None) != (self.top_number is None) or \
+                (top is not None and top.get('number') != self.top_number):
+            return 'The partial result ' + filepath + ' does not hold the counts requested.'
+        self.shard = shard
+        self.records = records
+        self.maxlen = maxlen
+        self.maxlen_num = maxlen_num
+        if top is not None:
+            self.top_identifiers = TopCounter(top['capacity'])
+            self.top_identifiers.counts = dict([(word.encode('iso-8859-2'), count) for word, count in top['counts']])
+            self.top_identifiers.error = top['error']
+        return None
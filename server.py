@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+#CST:xvitas02
+
+"""!
+@package server.py
+Serving the statistics from a long-running process.
+
+This module runs the command line over and over in a single
+process listening on a Unix socket (--serve). The counts of the
+files stay in memory between the runs, a file is only counted
+again once its size, modification time or inode change. Each
+request is a JSON line with the arguments, the working directory
+and the stdin of the client, the response a JSON line with what
+the run printed and its exit code (see client.py).
+"""
+
+import io
+import json
+import os
+import socket
+import sys
+import traceback
+from cache import MemoryCache
+
+
+class Server:
+
+    def __init__(self, socket_path, cache_size):
+        """!
+        @brief Prepares the server.
+
+        @param socket_path The path to the Unix socket to listen on.
+        @param cache_size The maximum number of files kept in memory.
+        """
+        self.socket_path = socket_path
+        self.cache = MemoryCache(cache_size)
+
+    def serve(self, run):
+        """!
+        @brief Answers the requests one after another until interrupted.
+
+        @param run The function running the command line, called with the cache (cst.main).
+        @return Returns None once interrupted, the error message if the socket cannot be listened on.
+        """
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.remove_stale_socket()
+            listener.bind(self.socket_path)
+            # only the user running the server can connect
+            os.chmod(self.socket_path, 0o600)
+            listener.listen()
+        except OSError as error:
+            listener.close()
+            return 'The socket ' + self.socket_path + ' cannot be listened on (' + str(error) + ').'
+
+        try:
+            while True:
+                connection, address = listener.accept()
+                with connection:
+                    try:
+                        self.handle(connection, run)
+                    # the client went away, the next one is waited for
+                    except (OSError, ValueError):
+                        continue
+        except KeyboardInterrupt:
+            return None
+        finally:
+            listener.close()
+            os.unlink(self.socket_path)
+
+    def remove_stale_socket(self):
+        """!
+        @brief Removes the socket left behind by a server which is not running any more.
+        Raises OSError if a server is still listening on it.
+        """
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            os.unlink(self.socket_path)
+            return
+        finally:
+            probe.close()
+        raise OSError('another server is listening on it')
+
+    def handle(self, connection, run):
+        """!
+        @brief Answers a request.
+
+        @param connection The socket connected to the client.
+        @param run The function running the command line.
+        """
+        with connection.makefile('rb') as reader:
+            request = json.loads(reader.readline())
+        response = self.run(request, run)
+        connection.sendall(json.dumps(response).encode() + b'\n')
+
+    def run(self, request, run):
+        """!
+        @brief Runs the command line of a request.
+        The arguments, the working directory and the standard streams
+        of the process are swapped for those of the client for the
+        time of the run.
+
+        @param request The dictionary of the request ('argv', 'cwd' and 'stdin' – latin-1 text or None).
+        @param run The function running the command line.
+        @return Returns the dictionary of the response ('stdout', 'stderr' and 'code').
+        """
+        stdin = request.get('stdin') or ''
+        saved = (sys.argv, sys.stdin, sys.stdout, sys.stderr, os.getcwd())
+        sys.argv = ['cst.py'] + request['argv']
+        sys.stdin = io.TextIOWrapper(io.BytesIO(stdin.encode('latin-1')))
+        sys.stdout = io.StringIO()
+        sys.stderr = io.StringIO()
+        code = 0
+        try:
+            os.chdir(request['cwd'])
+            run(self.cache)
+        except SystemExit as exit:
+            if isinstance(exit.code, str):
+                sys.stderr.write(exit.code + '\n')
+                code = 1
+            else:
+                code = exit.code or 0
+        # a bug should not take the server down
+        except Exception:
+            sys.stderr.write(traceback.format_exc())
+            code = 1
+        finally:
+            stdout = sys.stdout.getvalue()
+            stderr = sys.stderr.getvalue()
+            sys.argv, sys.stdin, sys.stdout, sys.stderr, cwd = saved
+            os.chdir(cwd)
+        return {'stdout': stdout, 'stderr': stderr, 'code': code}
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+#CST:xvitas02
+
+"""!
+@package sketch.py
+Counting the most frequent words in bounded memory.
+
+This module keeps a Misra-Gries summary of the words: the counts
+of at most a given number of words. While there are not more
+different words than that, the counts are exact. Once there are,
+the smallest counts are cut down, so each of the counts kept may
+be lower than the true one by up to the error, but any word more
+frequent than (number of words) / (capacity + 1) is still kept.
+Two summaries merge into a summary with the same guarantee, so the
+summaries of the files counted by the worker processes can be put
+together into the one of the whole tree.
+"""
+
+import heapq
+
+
+class TopCounter:
+
+    def __init__(self, capacity):
+        """!
+        @brief Starts with no words counted.
+
+        @param capacity The number of words kept, 0 to keep all of them (exact counts).
+        """
+        self.capacity = capacity
+        # word => count (at most the true count of the word)
+        self.counts = dict()
+        # how much lower than the true one any of the counts may be
+        self.error = 0
+
+    def add(self, word, number=1):
+        """!
+        @brief Counts the occurrences of a word.
+
+        @param word The word (bytes).
+        @param number The number of its occurrences.
+        """
+        self.counts[word] = self.counts.get(word, 0) + number
+        # cut down only once there are twice as many words, so it is not done on every new word
+        if self.capacity and len(self.counts) > 2 * self.capacity:
+            self.reduce()
+
+    def update(self, counts):
+        """!
+        @brief Counts the occurrences of more words.
+
+        @param counts The dictionary of word => number of occurrences.
+        """
+        for word, number in counts.items():
+            self.counts[word] = self.counts.get(word, 0) + number
+        if self.capacity and len(self.counts) > self.capacity:
+            self.reduce()
+
+    def merge(self, other):
+        """!
+        @brief Adds the words counted by another summary (of another file or worker process).
+
+        @param other The TopCounter to add.
+        """
+        self.update(other.counts)
+        self.error += other.error
+
+    def reduce(self):
+        """!
+        @brief Cuts the summary down to the capacity.
+        Subtracts the count of the first word over the capacity from
+        all the counts and drops the words left with nothing.
+        """
+        if len(self.counts) <= self.capacity:
+            return
+        cut = heapq.nlargest(self.capacity + 1, self.counts.values())[-1]
+        self.counts = dict([(word, count - cut) for word, count in self.counts.items() if count > cut])
+        self.error += cut
+
+    def is_exact(self):
+        """!
+        @brief Tells whether the counts are exact.
+
+        @return Returns True if no count was ever cut down.
+        """
+        return self.error == 0
+
+    def get_top(self, number):
+        """!
+        @brief Gets the most frequent words.
+
+        @param number The number of words.
+        @return Returns the list of [word, count] pairs, the most frequent first (ties by the word).
+        """
+        top = heapq.nsmallest(number, self.counts.items(), key=lambda item: (-item[1], item[0]))
+        return [[word.decode('iso-8859-2'), count] for word, count in top]
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+#CST:xvitas02
+
+"""!
+@package sorter.py
+Sorting more results than fit in memory.
+
+This module keeps the items added in memory up to a limit, each
+time the limit is reached they are sorted and spilled into a
+temporary file as a sorted run. Iterating merges the runs with
+the items still in memory, so the memory used depends on the
+limit instead of the number of items.
+"""
+
+import heapq
+import pickle
+import tempfile
+
+
+class Sorter:
+
+    def __init__(self, key, limit):
+        """!
+        @brief Starts with no items.
+
+        @param key The function returning the key to sort an item by.
+        @param limit The number of items kept in memory before they are spilled.
+        """
+        self.key = key
+        self.limit = limit
+        self.buffer = list()
+        # temporary files of the sorted runs spilled
+        self.runs = list()
+        self.size = 0
+
+    def __len__(self):
+        """!
+        @brief Gets the number of items added.
+
+        @return Returns the number of items.
+        """
+        return self.size
+
+    def __iter__(self):
+        """!
+        @brief Iterates over the items sorted.
+        Items with the same key come out in the order they were
+        added. The items can be iterated over any number of times,
+        but not twice at once.
+
+        @return Returns the iterator of the items.
+        """
+        self.buffer.sort(key=self.key)
+        if not self.runs:
+            return iter(self.buffer)
+        return heapq.merge(*([self.read_run(run) for run in self.runs] + [self.buffer]), key=self.key)
+
+    def append(self, item):
+        """!
+        @brief Adds an item.
+
+        @param item The item to add.
+        """
+        self.buffer.append(item)
+        self.size += 1
+        if len(self.buffer) >= self.limit:
+            self.spill()
+
+    def spill(self):
+        """!
+        @brief Writes the items in memory into a new sorted run.
+        """
+        self.buffer.sort(key=self.key)
+        run = tempfile.TemporaryFile()
+        for item in self.buffer:
+            pickle.dump(item, run, pickle.HIGHEST_PROTOCOL)
+        self.runs.append(run)
+        self.buffer = list()
+
+    def read_run(self, run):
+        """!
+        @brief Reads a sorted run back.
+
+        @param run The temporary file of the run.
+        @return Yields the items of the run.
+        """
+        run.seek(0)
+        while True:
+            try:
+                yield pickle.load(run)
+            except EOFError:
+                return
+
+    def close(self):
+        """!
+        @brief Drops all the items, the temporary files included.
+        """
+        for run in self.runs:
+            run.close()
+        self.runs = list()
+        self.buffer = list()
+        self.size = 0
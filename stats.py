@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+#CST:xvitas02
+
+"""!
+@package stats.py
+Measuring where the time of a run goes.
+
+This module records the wall time, the CPU time and the bytes
+processed by each stage of the counting (walking the directories,
+reading, lexing, building the views, each of the metrics and so on)
+along with the slowest files (--stats). The stages measured in the
+worker processes are merged into the stats of the main one.
+"""
+
+import contextlib
+import heapq
+import json
+import os
+import sys
+import time
+
+# the peak memory is only known on Unix
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class Stats:
+
+    def __init__(self, top):
+        """!
+        @brief Starts measuring the run.
+
+        @param top The number of the slowest files to keep.
+        """
+        self.top = top
+        # stage => [calls, wall seconds, CPU seconds, bytes]
+        self.stages = dict()
+        # (wall seconds, filepath, bytes) of the slowest files, the fastest of them first
+        self.slowest = list()
+        self.files = 0
+        # files not counted for being copies of others (--dedup) and their bytes
+        self.duplicates = [0, 0]
+        self.started = time.perf_counter()
+        self.started_times = os.times()
+
+    @contextlib.contextmanager
+    def measure(self, stage, size):
+        """!
+        @brief Measures a stage for the duration of the with block.
+
+        @param stage The name of the stage.
+        @param size The number of bytes the stage processes.
+        """
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - wall, time.process_time() - cpu, size)
+
+    def add(self, stage, wall, cpu, size, calls=1):
+        """!
+        @brief Adds the time spent in a stage.
+
+        @param stage The name of the stage.
+        @param wall The wall seconds.
+        @param cpu The CPU seconds.
+        @param size The number of bytes processed.
+        @param calls The number of times the stage ran.
+        """
+        numbers = self.stages.setdefault(stage, [0, 0.0, 0.0, 0])
+        numbers[0] += calls
+        numbers[1] += wall
+        numbers[2] += cpu
+        numbers[3] += size
+
+    def add_file(self, filepath, wall, size):
+        """!
+        @brief Adds a file counted.
+
+        @param filepath The path to the file.
+        @param wall The wall seconds counting the file took.
+        @param size The size of the file in bytes.
+        """
+        self.files += 1
+        if self.top == 0:
+            return
+        if len(self.slowest) < self.top:
+            heapq.heappush(self.slowest, (wall, filepath, size))
+        elif wall > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (wall, filepath, size))
+
+    def add_duplicates(self, files, size):
+        """!
+        @brief Adds the files which were not counted for being copies of others.
+
+        @param files The number of the copies.
+        @param size The bytes of the copies.
+        """
+        self.duplicates[0] += files
+        self.duplicates[1] += size
+
+    def merge(self, other):
+        """!
+        @brief Adds the stages and files measured by another Stats (of a worker process).
+
+        @param other The Stats to add.
+        """
+        for stage, numbers in other.stages.items():
+            self.add(stage, numbers[1], numbers[2], numbers[3], numbers[0])
+        self.files += other.files - len(other.slowest)
+        for wall, filepath, size in other.slowest:
+            self.add_file(filepath, wall, size)
+
+    def get_peak_rss(self):
+        """!
+        @brief Gets the peak resident memory of the process and of its worker processes.
+
+        @return Returns the tuple of the peaks in bytes, None if they are not known.
+        """
+        if resource is None:
+            return None, None
+        # kilobytes on Linux, bytes on macOS
+        unit = 1 if sys.platform == 'darwin' else 1024
+        return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit)
+
+    def get_summary(self):
+        """!
+        @brief Sums the run up.
+        The time of the stages run in worker processes is summed over
+        all of them, so it can add up to more than the wall time of
+        the whole run.
+
+        @return Returns the dictionary of the summary (serializable to JSON).
+        """
+        times = os.times()
+        cpu = sum(times[:4]) - sum(self.started_times[:4])
+        peak, peak_workers = self.get_peak_rss()
+        stages = dict()
+        for stage, numbers in self.stages.items():
+            stages[stage] = {'calls': numbers[0], 'wall': numbers[1], 'cpu': numbers[2], 'bytes': numbers[3],
+                             'mb_per_s': numbers[3] / 1e6 / numbers[1] if numbers[1] > 0 and numbers[3] else None}
+        slowest = [{'file': filepath, 'wall': wall, 'bytes': size}
+                   for wall, filepath, size in sorted(self.slowest, reverse=True)]
+        return {'wall': time.perf_counter() - self.started, 'cpu': cpu, 'files': self.files,
+                'duplicates': {'files': self.duplicates[0], 'bytes': self.duplicates[1]},
+                'peak_rss': peak, 'peak_rss_workers': peak_workers, 'stages': stages, 'slowest_files': slowest}
+
+    def format_summary(self, summary):
+        """!
+        @brief Formats the summary for a human reader.
+
+        @param summary The dictionary returned by get_summary.
+        @return Returns the text of the summary.
+        """
+        files_per_s = summary['files'] / summary['wall'] if summary['wall'] > 0 else 0
+        lines = ['%d files in %.3f s wall, %.3f s CPU (%.0f files/s)\n' %
+                 (summary['files'], summary['wall'], summary['cpu'], files_per_s)]
+        if summary['duplicates']['files']:
+            lines.append('%d copies of other files (%.1f MB) not counted again\n' %
+                         (summary['duplicates']['files'], summary['duplicates']['bytes'] / 1e6))
+        if summary['peak_rss'] is not None:
+            lines.append('peak RSS %.1f MB, %.1f MB in the largest worker process\n' %
+                         (summary['peak_rss'] / 1e6, summary['peak_rss_workers'] / 1e6))
+        lines.append('%-14s %9s %10s %10s %10s %9s\n' % ('stage', 'calls', 'wall s', 'CPU s', 'MB', 'MB/s'))
+        for stage, numbers in summary['stages'].items():
+            speed = '%9.1f' % numbers['mb_per_s'] if numbers['mb_per_s'] is not None else '%9s' % '-'
+            lines.append('%-14s %9d %10.3f %10.3f %10.1f %s\n' % (stage, numbers['calls'], numbers['wall'],
+                                                                    numbers['cpu'], numbers['bytes'] / 1e6, speed))
+        if summary['slowest_files']:
+            lines.append('slowest files:\n')
+            for item in summary['slowest_files']:
+                lines.append('%10.3f s %10.1f KB  %s\n' % (item['wall'], item['bytes'] / 1e3, item['file']))
+        return ''.join(lines)
+
+    def write(self, target):
+        """!
+        @brief Writes the summary out.
+
+        @param target '-' for stderr, otherwise the path to the JSON file.
+        """
+        summary = self.get_summary()
+        if target == '-':
+            sys.stderr.write(self.format_summary(summary))
+            return
+        with open(target, 'w', encoding='utf-8') as stats_handle:
+            json.dump(summary, stats_handle, indent=1)
+            stats_handle.write('\n')
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+#CST:xvitas02
+
+"""!
+@package test_counts.py
+Checking that the ways of counting a content agree.
+
+A content counted whole has to give the same record as the content
+read in chunks of any size, a directory counted at once the same
+report as its shards merged. A file counted whole has to take a small
+multiple of its size in memory, a big file read in chunks a bounded
+amount of memory.
+
+    python -m pytest -q
+"""
+
+import io
+import os
+import random
+import subprocess
+import sys
+import pytest
+from api import get_args_dict
+from benchmark import generate_source
+from parser import Parser
+
+directory = os.path.dirname(os.path.abspath(__file__))
+
+# the corners of the lexer and of the counters, each of them cut by the chunks somewhere
+tricky_source = (b'#include <stdio.h>\r\n#define MAX(a, b) \\\n    ((a) > (b) ? (a) : (b)) /* max */\n'
+                 b'#define LONG \\\r\n 1 \\\n\\\n 2\n'
+                 b'// a comment \\\n going on, int x = 1;\n'
+                 b'/** stars ***/ int /*/ still a comment */ y = 2; /* a * b / c **/\r'
+                 b'char *s = "a \\" /* string */ // \\\n still", c = \'\\\'\', d = \'"\';\n'
+                 b'unsigned long **p, *(q), (*r)(void); int *a[3], b = 4 * 5 / 6;\n'
+                 b'int f(const char *name, void **out) { return n->next >>= 2 && !m || x / *p; }\n'
+                 b'int \xe9t\xe9 = 1, z\xfd = 0x12 + \'\\n\';\n'
+                 b'/* not closed')
+
+# the runs longer than a match of the lexer or a window of the counters
+long_source = (b'#define M ' + b'\\\n' * 3000 + b'x\nint ' + b'a' * 5000 + b' = 1;\n/*' + b'*' * 3000 + b'/ int x; */\n'
+               b'char *t = "' + b'/ ' * 2000 + b'";\nint ' + b'*' * 2000 + b'p;\n')
+
+
+def get_source(source):
+    """!
+    @brief Gets a content to count.
+
+    @param source 'tricky', 'long' or 'generated' (a C file of the benchmark).
+    @return Returns the bytes of the content.
+    """
+    if source == 'tricky':
+        return tricky_source
+    if source == 'long':
+        return long_source
+    return generate_source(random.Random(2), 4 << 10, 0.2, 0.1).encode()
+
+
+def get_record(data, chunk_size, **options):
+    """!
+    @brief Counts a content with all the metrics, in chunks or whole.
+
+    @param data The bytes of the content.
+    @param chunk_size The number of bytes read at once, 0 for the whole content.
+    @param options Any other arguments of api.analyze (e.g. operator_histogram=True).
+    @return Returns the record of occurrences.
+    """
+    args_dict = get_args_dict(Parser.metrics_list, ['int', 'x', '->', 'a b'], True,
+                              options.get('operator_histogram', False), dict())
+    if chunk_size == 0:
+        return Parser().count_content(data, args_dict)
+    args_dict['chunk_size'] = chunk_size
+    return Parser().count_stream(io.BytesIO(data), args_dict, len(data))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 64, 4096])
+@pytest.mark.parametrize('source', ['tricky', 'long', 'generated'])
+@pytest.mark.parametrize('operator_histogram', [False, True])
+def test_chunked_counts(source, chunk_size, operator_histogram):
+    """!
+    @brief A content read in chunks (count_stream) gives the same record as the content counted whole.
+    With the operator histogram the operators are counted one by one (TokenCounter).
+    """
+    data = get_source(source)
+    assert get_record(data, chunk_size, operator_histogram=operator_histogram) == \
+        get_record(data, 0, operator_histogram=operator_histogram)
+
+
+def run_cst(arguments):
+    """!
+    @brief Runs the command line.
+
+    @param arguments The list of arguments of cst.py.
+    @return Returns what it wrote to stdout.
+    """
+    return subprocess.run([sys.executable, os.path.join(directory, 'cst.py')] + arguments, stdout=subprocess.PIPE,
+                          check=True).stdout
+
+
+def write_tree(tmp_path):
+    """!
+    @brief Writes a directory of C files to count.
+    The file of long inline comments comes after the one of multiline
+    comments in the walk, the width of the comments column must not
+    depend on that order.
+
+    @param tmp_path The directory to write the tree into.
+    @return Returns the path to the tree.
+    """
+    sources = tmp_path / 'src'
+    sources.mkdir()
+    (sources / 'tricky.c').write_bytes(tricky_source)
+    (sources / 'long.c').write_bytes(long_source)
+    (sources / 'a.c').write_bytes(b'/*' + b'x' * 598 + b'*/')
+    (sources / 'b.c').write_bytes(b'//' + b'y' * 99997)
+    rng = random.Random(3)
+    for index in range(12):
+        (sources / ('f' + str(index) + '.h')).write_bytes(generate_source(rng, 1 << 10, 0.2, 0.1).encode())
+    return sources
+
+
+def get_peak_memory(code):
+    """!
+    @brief Runs Python code in a process of its own and measures its peak memory.
+    Linux keeps ru_maxrss of the process which ran the Python (pytest
+    here), the peak of the new program itself is read from /proc.
+
+    @param code The Python code to run (the parser modules are importable).
+    @return Returns the peak resident set size of the process in bytes.
+    """
+    if not os.path.exists('/proc/self/status'):
+        pytest.skip('no /proc/self/status')
+    script = 'import sys\nsys.path.insert(0, ' + repr(directory) + ')\n' + code + \
+             '\nprint([line for line in open("/proc/self/status") if line.startswith("VmHWM:")][0])\n'
+    output = subprocess.run([sys.executable, '-c', script], stdout=subprocess.PIPE, check=True).stdout
+    return int(output.split()[-2]) * 1024
+
+
+@pytest.mark.parametrize('options', [['-k', '-o', '-i', '-c', '-w=int'], ['-c'], ['-o', '--operator-histogram', '-p'],
+                                     ['-k', '-c', '-w=x', '--format=csv', '--sort']])
+def test_sharded_report(tmp_path, options):
+    """!
+    @brief A directory counted at once, in chunks and in three shards merged gives the same report.
+    """
+    sources = write_tree(tmp_path)
+    whole = run_cst(['--input=' + str(sources), '--chunk-size=0'] + options)
+    assert run_cst(['--input=' + str(sources), '--chunk-size=64'] + options) == whole
+    partials = list()
+    for shard in range(1, 4):
+        partials.append(str(tmp_path / ('part' + str(shard))))
+        run_cst(['--input=' + str(sources), '--shard=' + str(shard) + '/3', '--output=' + partials[-1]] + options)
+    assert run_cst(['--merge=' + partial for partial in partials] + options) == whole
+
+
+@pytest.mark.parametrize('options', [['-c'], ['-k', '-o', '-i', '-c', '-w=int', '-p']])
+def test_dedup_report(tmp_path, options):
+    """!
+    @brief A directory with copies of a file counted once (--dedup) gives the same report as counted file by file.
+    """
+    sources = tmp_path / 'src'
+    sources.mkdir()
+    # one file in each directory, so they are walked in this order, the copy counted right after the original
+    # with --dedup, before the file of inline comments
+    (sources / 'a.c').write_bytes(b'/*' + b'x' * 598 + b'*/')
+    (sources / 'd').mkdir()
+    (sources / 'd' / 'b.c').write_bytes(b'//' + b'y' * 99997)
+    (sources / 'd' / 'd').mkdir()
+    (sources / 'd' / 'd' / 'c.c').write_bytes(b'/*' + b'x' * 598 + b'*/')
+    assert run_cst(['--input=' + str(sources), '--dedup'] + options) == run_cst(['--input=' + str(sources)] + options)
+
+
+@pytest.mark.parametrize('line', [b'(void *)0x0001, ', b'0x12, ', b'int   \n', b'/* x*y/ */\n'])
+def test_chunked_memory(tmp_path, line):
+    """!
+    @brief A file of 8 MiB read in chunks of 64 KiB takes a few MiB more than importing the parser.
+    """
+    path = tmp_path / 'big.c'
+    path.write_bytes(b'int t[] = {\n' + line * ((8 << 20) // len(line)) + b'};\n')
+    idle = get_peak_memory('import api')
+    counted = get_peak_memory('import api\nlist(api.analyze(' + repr(str(path)) + ', chunk_size=1 << 16))')
+    assert counted - idle < 32 << 20
+
+
+@pytest.mark.parametrize('line', [b'(void *)0x0001, ', b'int   \n', b'/* x*y/ */\n', None])
+def test_whole_memory(tmp_path, line):
+    """!
+    @brief A file of 8 MiB counted whole takes less than four times its size more than importing the parser.
+    That is the file mapped, a view of it (e.g. the code) and the code left after the pointer declarations.
+    """
+    size = 8 << 20
+    path = tmp_path / 'big.c'
+    if line is None:
+        path.write_bytes(generate_source(random.Random(1), size, 0.1, 0.05).encode())
+    else:
+        path.write_bytes(b'int t[] = {\n' + line * (size // len(line)) + b'};\n')
+    idle = get_peak_memory('import api')
+    counted = get_peak_memory('import api\nlist(api.analyze(' + repr(str(path)) + ', chunk_size=0, '
+                              'patterns=["x", "int", "void", "t"]))')
+    assert counted - idle < 4 * size
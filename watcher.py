@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+#CST:xvitas02
+
+"""!
+@package watcher.py
+Watching the files for changes.
+
+This module polls the files counted for changes of their size,
+modification time or inode, so that only the files added,
+modified or deleted since the last report have to be counted
+again (--watch).
+"""
+
+import time
+
+
+class Watcher:
+    # seconds the files have to stay the same for a burst of changes to be over
+    debounce = 0.5
+
+    def __init__(self, interval):
+        """!
+        @brief Sets up the polling.
+
+        @param interval The number of seconds between two polls.
+        """
+        self.interval = interval
+
+    def wait_for_changes(self, get_snapshot, snapshot):
+        """!
+        @brief Waits until some of the files change.
+        Polls the files every interval seconds. Once a change is
+        found, it keeps polling until nothing changes for debounce
+        seconds, so a burst of edits (a save of many files, a checkout)
+        ends up in a single batch.
+
+        @param get_snapshot The function returning the current snapshot of the files.
+        @param snapshot The snapshot of the files at the last report (filepath => (size, mtime, inode)).
+        @return Returns the tuple of the new snapshot, the list of the filepaths added or modified
+        and the list of the filepaths deleted.
+        """
+        current = snapshot
+        while current == snapshot:
+            time.sleep(self.interval)
+            current = get_snapshot()
+        # coalescing the burst
+        while True:
+            time.sleep(self.debounce)
+            latest = get_snapshot()
+            if latest == current:
+                break
+            current = latest
+        changed = [filepath for filepath in current if snapshot.get(filepath) != current[filepath]]
+        deleted = [filepath for filepath in snapshot if filepath not in current]
+        return current, changed, deleted
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+#CST:xvitas02
+
+"""!
+@package writer.py
+Writing the report.
+
+This module writes the report through a single buffered handle
+(the output file or stdout), either as the aligned text or as
+machine-readable JSON Lines or CSV (--format). The machine
+formats can be written record by record as the files are counted.
+"""
+
+import abc
+import csv
+import json
+import sys
+
+
+class Writer(abc.ABC):
+    # names of the formats and the classes writing them, filled in below
+    formats = dict()
+
+    def __init__(self, output_file, keys):
+        """!
+        @brief Opens the output.
+
+        @param output_file The path to the output file, None for stdout.
+        @param keys The list of record keys written, in the order of the columns.
+        """
+        self.output_file = output_file
+        self.keys = keys
+        if output_file is None:
+            self.handle = sys.stdout
+        else:
+            self.handle = open(output_file, 'w', encoding='iso-8859-2')
+
+    def write(self, line):
+        """!
+        @brief Writes a line as it is (the text report, a shard of it).
+
+        @param line The formatted line, including the newline.
+        """
+        self.handle.write(line)
+
+    def write_header(self):
+        """!
+        @brief Writes what comes before the first record.
+        """
+        pass
+
+    @abc.abstractmethod
+    def restart(self):
+        """!
+        @brief Starts a new report (--watch).
+        The output file only holds the latest report, how the reports
+        written to stdout follow each other depends on the format.
+        """
+
+    def rewind(self):
+        """!
+        @brief Empties the output file (stdout is left as it is).
+        """
+        if self.output_file is not None:
+            self.handle.seek(0)
+            self.handle.truncate()
+
+    def flush(self):
+        """!
+        @brief Pushes everything written so far out.
+        """
+        self.handle.flush()
+
+    def close(self):
+        """!
+        @brief Flushes the output and closes the output file.
+        """
+        if self.output_file is None:
+            self.handle.flush()
+        else:
+            self.handle.close()
+
+
+class TextWriter(Writer):
+
+    def restart(self):
+        """!
+        @brief Starts a new report (--watch).
+        The reports written to stdout are separated by an empty line.
+        """
+        if self.output_file is None:
+            self.handle.write('\n')
+        self.rewind()
+
+
+class RecordWriter(Writer):
+
+    @abc.abstractmethod
+    def write_record(self, kind, filepath, record):
+        """!
+        @brief Writes a record.
+
+        @param kind 'file' for a file, 'total' for the totals, 'delta' for the change of a file (--since).
+        @param filepath The filepath to print, None for the totals.
+        @param record The dictionary of record key => number, the keys missing are left out.
+        """
+
+    def restart(self):
+        """!
+        @brief Starts a new report (--watch).
+        The records of each of the reports come after a header of their own.
+        """
+        self.rewind()
+        self.write_header()
+
+
+class JsonWriter(RecordWriter):
+
+    def write_record(self, kind, filepath, record):
+        """!
+        @brief Writes a record as a JSON object on a line of its own.
+
+        @param kind 'file' for a file, 'total' for the totals, 'delta' for the change of a file (--since).
+        @param filepath The filepath to print, None for the totals.
+        @param record The dictionary of record key => number (or list of [identifier, count] pairs),
+        the keys missing are left out.
+        """
+        items = [('kind', kind), ('file', filepath)] + [(key, record[key]) for key in self.keys if key in record]
+        self.handle.write(json.dumps(dict(items)) + '\n')
+
+
+class CsvWriter(RecordWriter):
+
+    def __init__(self, output_file, keys):
+        """!
+        @brief Opens the output.
+
+        @param output_file The path to the output file, None for stdout.
+        @param keys The list of record keys written, in the order of the columns.
+        """
+        RecordWriter.__init__(self, output_file, keys)
+        self.csv_writer = csv.writer(self.handle, lineterminator='\n')
+
+    def write_header(self):
+        """!
+        @brief Writes the row of the column names.
+        """
+        self.csv_writer.writerow(['kind', 'file'] + self.keys)
+
+    def write_record(self, kind, filepath, record):
+        """!
+        @brief Writes a record as a CSV row.
+
+        @param kind 'file' for a file, 'total' for the totals, 'delta' for the change of a file (--since).
+        @param filepath The filepath to print, None for the totals (an empty cell).
+        @param record The dictionary of record key => number, the keys missing are left empty.
+        """
+        row = [kind, filepath]
+        for key in self.keys:
+            value = record.get(key, '')
+            # the [identifier, count] pairs of --top-identifiers, in a single cell
+            if isinstance(value, list):
+                value = ' '.join([name + ':' + str(number) for name, number in value])
+            row.append(value)
+        self.csv_writer.writerow(row)
+
+
+Writer.formats = {'text': TextWriter, 'jsonl': JsonWriter, 'csv': CsvWriter}
+
+
+def get_writer(output_format, output_file, keys):
+    """!
+    @brief Opens the writer of a format.
+
+    @param output_format The name of the format (text, jsonl, csv).
+    @param output_file The path to the output file, None for stdout.
+    @param keys The list of record keys written, in the order of the columns.
+    @return Returns the Writer, with the header written.
+    """
+    writer = Writer.formats[output_format](output_file, keys)
+    writer.write_header()
+    return writer